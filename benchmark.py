@@ -0,0 +1,361 @@
+"""Benchmarks the message hot path without connecting to Discord, and compares the memory used to keep reposted messages.
+
+Usage: python benchmark.py [--sizes 1000 10000 100000] [--save FILE] [--compare FILE]
+       python benchmark.py --check [replace_corpus.json]
+"""
+
+import argparse
+import json
+import random
+import string
+import sys
+import time
+import tracemalloc
+
+import discord
+from discord.state import ConnectionState
+
+from cogs.emojis import finder
+from cogs.utils import emojis, faked, formats, prefixes
+
+# Importing bot.py is safe since it only runs when executed directly
+from bot import EmoteWizard
+
+WORDS = [
+    "the", "a", "lol", "ok", "what", "is", "this", "i", "you", "that", "game", "tonight", "yeah",
+    "no", "wait", "why", "discord", "server", "emoji", "nice", "gg", "same", "bruh", "love", "it",
+]
+
+class FakeEmoji:
+    __slots__ = ("id", "name", "animated", "guild_id")
+
+    def __init__(self, id, name, animated, guild_id):
+        self.id = id
+        self.name = name
+        self.animated = animated
+        self.guild_id = guild_id
+
+    def __str__(self):
+        return f"<{'a' if self.animated else ''}:{self.name}:{self.id}>"
+
+class FakeGuild:
+    def __init__(self, id, emojis=()):
+        self.id = id
+        self.emojis = emojis
+
+class FakeUser:
+    def __init__(self, id, bot=False):
+        self.id = id
+        self.bot = bot
+
+    @property
+    def mention(self):
+        return f"<@{self.id}>"
+
+class FakeMessage:
+    def __init__(self, id, content, author):
+        self.id = id
+        self.content = content
+        self.author = author
+        self.jump_url = f"https://discord.com/channels/1/2/{id}"
+        self.embeds = []
+        self.attachments = [object()] if not content else []
+        self.stickers = []
+
+class FakeBot:
+    """Carries just enough state for the bot methods that are benchmarked."""
+
+    replace_emojis = EmoteWizard.replace_emojis
+
+    def __init__(self, guilds):
+        self.user = FakeUser(10**17)
+        self.emoji_index = emojis.EmojiIndex()
+        self.emoji_index.build(guilds)
+
+        self.prefixes = {}
+        self.prefix_matcher = prefixes.PrefixMatcher(self)
+
+def make_catalogue(size, rng):
+    names = set()
+    while len(names) < size:
+        length = rng.randint(2, 16)
+        names.add("".join(rng.choices(string.ascii_letters + string.digits + "_", k=length)))
+
+    guilds = []
+    catalogue = []
+    for counter, name in enumerate(sorted(names)):
+        if counter % 50 == 0:
+            guilds.append(FakeGuild(counter, []))
+        emoji = FakeEmoji(10**17 + counter, name, rng.random() < 0.2, guilds[-1].id)
+        guilds[-1].emojis.append(emoji)
+        catalogue.append(emoji)
+
+    return guilds, catalogue
+
+def make_messages(catalogue, count, rng):
+    """Builds messages with a long tailed length distribution similar to chat traffic."""
+
+    messages = []
+    for _ in range(count):
+        length = min(2000, int(rng.lognormvariate(3.5, 1.0)))
+        words = []
+        size = 0
+
+        while size < length:
+            roll = rng.random()
+            if roll < 0.05:
+                word = f":{rng.choice(catalogue).name}:"
+            elif roll < 0.07:
+                word = f";{rng.choice(catalogue).name};"
+            elif roll < 0.08:
+                word = f":{rng.choice(WORDS)}:"
+            elif roll < 0.09:
+                word = str(rng.choice(catalogue))
+            else:
+                word = rng.choice(WORDS)
+
+            words.append(word)
+            size += len(word) + 1
+
+        messages.append(" ".join(words)[:2000])
+
+    return messages
+
+def measure(func, inputs, duration):
+    """Calls func on inputs in a cycle for about duration seconds and returns the timings."""
+
+    timings = []
+    start = time.perf_counter()
+    counter = 0
+
+    while True:
+        value = inputs[counter % len(inputs)]
+        before = time.perf_counter_ns()
+        func(value)
+        timings.append(time.perf_counter_ns() - before)
+
+        counter += 1
+        if counter >= len(inputs) and time.perf_counter() - start >= duration:
+            break
+
+    elapsed = sum(timings) / 1e9
+    timings.sort()
+
+    return {
+        "calls": len(timings),
+        "throughput": len(timings) / elapsed if elapsed else 0.0,
+        "p50": timings[len(timings) // 2] / 1000,
+        "p99": timings[min(len(timings) - 1, int(len(timings) * 0.99))] / 1000,
+    }
+
+def cases(size, rng):
+    """Yields the name and callable of each benchmark for a catalogue size."""
+
+    guilds, catalogue = make_catalogue(size, rng)
+    bot = FakeBot(guilds)
+    messages = make_messages(catalogue, 500, rng)
+    queries = ["".join(rng.sample(emoji.name, min(3, len(emoji.name)))) for emoji in rng.sample(catalogue, 50)]
+
+    yield "replace_emojis", bot.replace_emojis, messages
+    yield "finder", lambda query: finder(query, catalogue, key=lambda emoji: emoji.name, lazy=False), queries
+    yield "emoji_index.search", lambda query: bot.emoji_index.search(query, limit=250), queries
+
+    author = FakeUser(1)
+    quotes = [FakeMessage(counter, message if counter % 10 else "", author) for counter, message in enumerate(messages)]
+    replies = [(faked.Reply(bot=bot, quote=quote, emoji="<:user_1:1>", mention=True), message) for quote, message in zip(quotes, messages)]
+    yield "Reply.format_with", lambda reply: reply[0].format_with(reply[1]), replies
+
+    rows = [[emoji.id, emoji.name, emoji.animated, emoji.guild_id] for emoji in catalogue[:200]]
+
+    def tabulate(rows):
+        table = formats.Tabulate()
+        table.add_columns(["id", "name", "animated", "guild_id"])
+        table.add_rows(rows)
+        return table.draw()
+
+    yield "Tabulate", tabulate, [rows[:count] for count in (1, 10, 50, 200)]
+
+    # One in ten guilds has its own prefixes and one in twenty messages is a command
+    prefix_guilds = [FakeGuild(counter) for counter in range(1000)]
+    old_prefixes = {}
+    for guild in prefix_guilds[::10]:
+        custom = rng.sample(["!", "?", "e!", "e.", "em ", "$"], 3)
+        old_prefixes[str(guild.id)] = list(custom)
+        bot.prefixes[guild.id] = tuple(custom)
+
+    prefixed = [
+        (rng.choice(prefix_guilds), f"e!{message}" if counter % 20 == 0 else message)
+    for counter, message in enumerate(messages)]
+
+    def old_get_prefix(item):
+        guild, content = item
+
+        # What get_prefix, Config.get and Bot.get_context did before the matcher
+        prefixes = [f"<@!{bot.user.id}> ", f"<@{bot.user.id}> "]
+        prefixes.extend(old_prefixes.get(str(guild.id), ["e!", "e."]))
+        return content.startswith(tuple(list(prefixes)))
+
+    def get_prefix(item):
+        guild, content = item
+        return content.startswith(bot.prefix_matcher.get(guild))
+
+    yield "get_prefix (old)", old_get_prefix, prefixed
+    yield "get_prefix", get_prefix, prefixed
+
+def message_payload(id, content):
+    return {
+        "id": str(id),
+        "channel_id": "1",
+        "type": 0,
+        "content": content,
+        "author": {"id": "1", "username": "user", "discriminator": "0", "avatar": None, "global_name": None},
+        "attachments": [],
+        "embeds": [],
+        "mentions": [],
+        "mention_roles": [],
+        "mention_everyone": False,
+        "pinned": False,
+        "tts": False,
+        "flags": 0,
+        "timestamp": "2024-01-01T00:00:00+00:00",
+        "edited_timestamp": None,
+    }
+
+def allocated(build):
+    """Gets the bytes allocated by the objects build returns."""
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    objects = build()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    return size, len(objects)
+
+def memory_cases(messages, rng):
+    """Yields the name, total bytes and count for each way of keeping reposted messages around."""
+
+    # A detached connection state is enough to build real message objects
+    state = ConnectionState(dispatch=lambda *args: None, handlers={}, hooks={}, http=None, intents=discord.Intents.default())
+    channel = discord.Object(1)
+
+    def cached_messages():
+        return [discord.Message(state=state, channel=channel, data=message_payload(counter, message)) for counter, message in enumerate(messages)]
+
+    yield "discord.Message (message cache)", *allocated(cached_messages)
+
+    def faked_messages():
+        return [
+            faked.FakedMessage(
+                replacement_id=10**18 + counter,
+                original_id=10**18 + counter + 1,
+                channel_id=10**17,
+                guild_id=10**17 + 1,
+                author_id=10**17 + 2,
+                webhook_id=10**17 + 3,
+                webhook_token="".join(rng.choices(string.ascii_letters, k=68))
+            )
+        for counter in range(len(messages))]
+
+    yield "FakedMessage", *allocated(faked_messages)
+
+def compare(results, baseline, threshold):
+    """Returns the benchmarks whose p50 latency regressed by more than threshold."""
+
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline or "p50" not in result:
+            continue
+
+        change = result["p50"] / baseline[key]["p50"] - 1 if baseline[key]["p50"] else 0.0
+        if change > threshold:
+            regressions.append((key, change))
+
+    return regressions
+
+def check(filename):
+    """Runs replace_emojis over a corpus of golden outputs and returns the cases that don't match.
+
+    Cases with a changed note are ones where the output deliberately differs from the original implementation.
+    """
+
+    with open(filename, "r") as file:
+        corpus = json.load(file)
+
+    guild = FakeGuild(0, [FakeEmoji(emoji["id"], emoji["name"], emoji["animated"], 0) for emoji in corpus["emojis"]])
+    bot = FakeBot([guild])
+
+    failures = []
+    for case in corpus["cases"]:
+        replaced, found = bot.replace_emojis(case["input"])
+        if replaced != case["expected"] or found != case["found"]:
+            failures.append((case, replaced, found))
+
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the message hot path")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000, 100000], help="Emoji catalogue sizes")
+    parser.add_argument("--duration", type=float, default=1.0, help="Seconds to spend on each benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="Save the results as a baseline to this file")
+    parser.add_argument("--compare", help="Compare the results against a saved baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed p50 regression before failing")
+    parser.add_argument("--check", nargs="?", const="replace_corpus.json", help="Check replace_emojis against a golden corpus instead of benchmarking")
+    args = parser.parse_args()
+
+    if args.check:
+        failures = check(args.check)
+        for case, replaced, found in failures:
+            print(f"Mismatch: {case['input']!r} gave {replaced!r} {found!r}, expected {case['expected']!r} {case['found']!r}")
+
+        print(f"{len(failures)} of the cases in {args.check} failed" if failures else f"Every case in {args.check} passed")
+        sys.exit(1 if failures else 0)
+
+    results = {}
+
+    table = formats.Tabulate()
+    table.add_columns(["benchmark", "emojis", "calls", "ops/s", "p50 (us)", "p99 (us)"])
+
+    for size in args.sizes:
+        # Seed each size separately so the data doesn't depend on the other sizes
+        rng = random.Random(args.seed * 1000003 + size)
+
+        for name, func, inputs in cases(size, rng):
+            result = measure(func, inputs, args.duration)
+            results[f"{name}/{size}"] = result
+            table.add_row([name, size, result["calls"], f"{result['throughput']:.0f}", f"{result['p50']:.1f}", f"{result['p99']:.1f}"])
+
+    print(table)
+
+    # Compare the memory of caching messages against the compact records used for reposts
+    table = formats.Tabulate()
+    table.add_columns(["record", "count", "total", "bytes each"])
+
+    rng = random.Random(args.seed)
+    messages = make_messages(make_catalogue(1000, rng)[1], 10000, rng)
+
+    for name, size, count in memory_cases(messages, rng):
+        results[f"memory/{name}"] = {"bytes": size / count}
+        table.add_row([name, count, f"{size / 1024 / 1024:.1f} MB", f"{size / count:.0f}"])
+
+    print(table)
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent=4)
+
+    if args.compare:
+        with open(args.compare, "r") as file:
+            baseline = json.load(file)
+
+        regressions = compare(results, baseline, args.threshold)
+        for key, change in regressions:
+            print(f"Regression: {key} p50 is {change:.0%} slower than the baseline")
+
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,28 @@
+import time
+
+# Measured from here so the startup timeline includes importing discord.py and the cogs' dependencies
+started = time.perf_counter()
+
 import discord
 from discord import app_commands
 from discord.ext import commands
 
 import aiohttp
+import asyncio
 import asyncpg
 import datetime
 import json
 import logging
 import os
-import re
 import sys
 import traceback
 
-from cogs.utils import cache, config
+from cogs.utils import attachments, avatars, cache, cluster, directory, emojis, faked, invalidation, migrations, prefixes, ratelimits, repost, scheduler, webhooks
 
 logging.basicConfig(level=logging.INFO, format="(%(asctime)s) %(levelname)s %(message)s", datefmt="%m/%d/%y - %H:%M:%S %Z",)
 
 def get_prefix(bot, message):
-    prefixes = [f"<@!{bot.user.id}> ", f"<@{bot.user.id}> "]
-    if message.guild:
-        prefixes.extend(bot.prefixes.get(message.guild.id, ["e!", "e."]))
-    else:
-        prefixes.extend(["e!", "e.", "!"])
-    return prefixes
+    return bot.prefix_matcher.get(message.guild)
 
 extensions = ["cogs.meta", "cogs.admin", "cogs.replies", "cogs.emojis", "cogs.stickers"]
 
@@ -35,6 +35,9 @@ class GuildConfig:
         self.guild_id = record["guild_id"]
         self.webhook_id = record["webhook_id"]
 
+        # The resolved webhook, kept so reposts don't need to fetch it every time
+        self._webhook = None
+
         return self
 
     @property
@@ -45,23 +48,55 @@ class GuildConfig:
         if not self.webhook_id:
             return None
 
-        try:
-            return await self.bot.fetch_webhook(self.webhook_id)
-        except discord.HTTPException:
-            return None
+        if not self._webhook:
+            try:
+                self._webhook = await self.bot.fetch_webhook(self.webhook_id)
+            except discord.HTTPException:
+                return None
 
-    async def set_webhook(self, webhook):
-        self.webhook_id = webhook.id if webhook else None
+        return self._webhook
+
+    async def webhook_for(self, channel):
+        """Gets a webhook that posts in a channel.
+
+        Returns None if no webhook is set, since setting one opts the guild in to reposting.
+        """
+
+        webhook = await self.webhook()
+
+        if not webhook or webhook.channel == channel:
+            return webhook
+
+        pooled = await self.bot.webhook_pool.get(channel)
+        if pooled:
+            return pooled
 
+        # Otherwise fall back to moving the configured webhook
+        # Editing returns a new webhook object instead of updating this one
+        webhook = self._webhook = await webhook.edit(channel=channel)
+        return webhook
+
+    def invalidate_webhook(self, channel=None):
+        """Drops the cached webhook, and the pooled one for a channel, so they get fetched again next time."""
+
+        self._webhook = None
+
+        if channel:
+            self.bot.webhook_pool.forget(channel)
+
+    async def set_webhook(self, webhook):
         query = """INSERT INTO guild_config (guild_id, webhook_id)
                    VALUES ($1, $2)
                    ON CONFLICT (guild_id) DO UPDATE
                    SET webhook_id=$2;
                 """
-        await self.bot.db.execute(query, self.guild_id, self.webhook_id)
+        await self.bot.db.execute(query, self.guild_id, webhook.id if webhook else None)
+
+        # Drop this config instead of changing it, so the next lookup loads what was written
+        self.bot.invalidation.publish(invalidation.GUILD_CONFIG, self.guild_id)
 
-class EmoteWizard(commands.Bot):
-    def __init__(self):
+class EmoteWizard(commands.AutoShardedBot):
+    def __init__(self, *, cluster_id=0, shard_ids=None, shard_count=None):
         intents = discord.Intents(
             guilds=True,
             emojis=True,
@@ -71,16 +106,42 @@ class EmoteWizard(commands.Bot):
             webhooks=True
         )
 
+        # Reads the rate limit headers of every response, so it has to exist before the HTTP client
+        self.rate_limiter = ratelimits.RateLimiter()
+        self.invalidation = invalidation.InvalidationBus()
+
+        # Set by the launcher when this process runs some of the shards of a cluster
+        self.cluster_id = cluster_id
+
+        # How long each stage of starting up took, in seconds
+        self.startup = {}
+        self._last_mark = started
+        self.mark_startup("import")
+
         super().__init__(
             command_prefix=get_prefix,
             intents=intents,
+            # Reactions are handled from raw events, so there is no need to cache messages
+            max_messages=None,
+            http_trace=self.rate_limiter.trace_config(),
+            shard_ids=shard_ids,
+            shard_count=shard_count,
             allowed_installs=app_commands.AppInstallationType(guild=True, user=False)
         )
 
     async def setup_hook(self):
+        self.mark_startup("login")
         self.uptime = datetime.datetime.utcnow()
-        self.prefixes = config.Config("prefixes.json")
-        self.faked_messages = {}
+        self.emoji_index = emojis.EmojiIndex()
+        self.webhook_pool = webhooks.WebhookPool(self)
+        self.reposts = scheduler.RepostScheduler()
+        self.attachments = attachments.AttachmentForwarder()
+        self.repost_executor = repost.RepostExecutor(self)
+
+        self.invalidation.register(invalidation.GUILD, self.get_webhook_config.invalidate_key)
+        self.invalidation.register(invalidation.GUILD, self.webhook_pool.forget_guild)
+        self.invalidation.register(invalidation.GUILD_CONFIG, self.get_webhook_config.invalidate_key)
+        self.invalidation.register(invalidation.WEBHOOKS, self._invalidate_configured_webhook)
 
         if not os.path.exists("stickers"):
             os.mkdir("stickers")
@@ -96,40 +157,51 @@ class EmoteWizard(commands.Bot):
                 format="text"
             )
         self.db = await asyncpg.create_pool(self.config.sql, init=init)
+        self.faked_messages = faked.FakedMessageStore(self.db)
 
-        query = """CREATE TABLE IF NOT EXISTS guild_config (
-                   guild_id BIGINT PRIMARY KEY,
-                   webhook_id BIGINT
-                   );
-
-                   CREATE TABLE IF NOT EXISTS stickers (
-                   owner_id BIGINT,
-                   name TEXT UNIQUE,
-                   content_path TEXT
-                   );
-
-                   CREATE TABLE IF NOT EXISTS avatar_emojis (
-                   user_id BIGINT PRIMARY KEY,
-                   emoji_id BIGINT,
-                   avatar_url TEXT,
-                   last_used TIMESTAMP DEFAULT (now() at time zone 'utc')
-                   );
-                """
-        await self.db.execute(query)
+        self.mark_startup("database")
 
-        avatar_emojis = await self.db.fetch("SELECT * FROM avatar_emojis;")
-        self.avatar_emojis = {emoji["user_id"]: dict(emoji) for emoji in avatar_emojis}
+        await migrations.migrate(self.db)
+        self.mark_startup("migrations")
 
-        await self.load_extension("jishaku")
+        self.prefixes = prefixes.PrefixStore(self)
+        self.prefix_matcher = prefixes.PrefixMatcher(self)
+        self.invalidation.register(invalidation.PREFIXES, self.prefix_matcher.invalidate)
+        self.invalidation.register(invalidation.GUILD, self.prefix_matcher.invalidate)
+        await self.prefixes.import_json("prefixes.json")
 
-        for cog in extensions:
-            try:
-                await self.load_extension(cog)
-            except Exception as exc:
-                logging.info(f"Couldn't load {cog}")
-                traceback.print_exception(type(exc), exc, exc.__traceback__, file=sys.stderr)
+        self.emoji_directory = directory.EmojiDirectory(self, self.emoji_index)
+
+        # Avatar emojis are read from the database when a reply needs one, so nothing is loaded for them here
+        self.avatar_emojis = avatars.AvatarEmojiStore(self)
+        self.shard_health = cluster.ShardHealth(self)
+        self.shard_health.start()
+
+        await asyncio.gather(self.prefixes.start(), self.emoji_directory.start())
+        self.mark_startup("state")
+
+        # The extensions don't depend on each other, so load them together
+        await asyncio.gather(*[self._load_extension(cog) for cog in ["jishaku", *extensions]])
+        self.mark_startup("extensions")
+
+    async def _load_extension(self, cog):
+        try:
+            await self.load_extension(cog)
+        except Exception as exc:
+            logging.info(f"Couldn't load {cog}")
+            traceback.print_exception(type(exc), exc, exc.__traceback__, file=sys.stderr)
 
-    @cache.cache()
+    def mark_startup(self, stage):
+        """Records and logs how long a stage of starting up took."""
+
+        now = time.perf_counter()
+        self.startup[stage] = now - self._last_mark
+        self._last_mark = now
+
+        logging.info(f"Startup: {stage} took {self.startup[stage]*1000:.0f}ms ({(now - started)*1000:.0f}ms total)")
+
+    # Writes and Discord events invalidate entries through the bus, so the TTL only bounds how stale a missed event can leave one
+    @cache.cache(max_length=10000, ttl=24 * 60 * 60, key=lambda guild: guild.id)
     async def get_webhook_config(self, guild):
         query = """SELECT *
                    FROM guild_config
@@ -144,53 +216,80 @@ class EmoteWizard(commands.Bot):
 
     async def on_ready(self):
         logging.info(f"Logged in as {self.user.name} - {self.user.id}")
+
+        if "ready" not in self.startup:
+            self.mark_startup("ready")
+
+        await self.emoji_directory.sync(self.guilds)
         self.guild = self.get_guild(self.config.guild)
-        self.console = bot.get_channel(self.config.console)
+        # The console channel might be on another process's shard, so don't rely on it being cached
+        self.console = self.get_partial_messageable(self.config.console)
 
-    def get_guild_prefix(self, guild):
-        return self.prefixes.get(guild.id, [self.user.mention])[0]
+    async def on_guild_join(self, guild):
+        # Anything cached from before the bot left might be out of date
+        self.invalidation.publish(invalidation.GUILD, guild.id)
+        await self.emoji_directory.sync_guild(guild)
 
-    def get_guild_prefixes(self, guild):
-        return self.prefixes.get(guild.id, ["e!", "e."])
+    async def on_guild_available(self, guild):
+        # Guilds become available while starting too, and those are synced together on ready.
+        # Ones that were unavailable then were skipped, so sync them now.
+        if not self.is_ready():
+            return
 
-    def replace_emojis(self, content):
-        replaced = content
+        await self.emoji_directory.sync_guild(guild)
 
-        # Look for 'emojis' in the message
-        emojis = re.finditer("\;[^;]+\;", content)
-        possible_emojis = re.finditer("\:\w+:", content)
+    async def on_guild_remove(self, guild):
+        self.invalidation.publish(invalidation.GUILD, guild.id)
+        await self.emoji_directory.remove_guild(guild)
 
-        # Iter through the found emois name
-        found = []
+    async def on_guild_emojis_update(self, guild, before, after):
+        await self.emoji_directory.update(guild, before, after)
 
-        # Replace emojis using ;emoji;
-        for name in emojis:
-            emoji = discord.utils.get(self.emojis, name=name.group(0).replace(";", ""))
-            if emoji and str(emoji) not in found:
-                replaced = replaced.replace(name.group(0), str(emoji))
-                found.append(str(emoji))
+    async def on_webhooks_update(self, channel):
+        self.invalidation.publish(invalidation.WEBHOOKS, channel.guild.id, channel.id)
 
-        # Replace emojis using :emoji:
-        for name in possible_emojis:
-            emoji = discord.utils.get(self.emojis, name=name.group(0).replace(":", ""))
-            span = name.span(0)
-            full_emoji = re.search(".*<a?", content[:span[0]]) and re.search("\d+>.*", content[span[1]+1:])
-            if emoji and str(emoji) not in found and not full_emoji:
-                replaced = replaced.replace(name.group(0), str(emoji))
-                found.append(str(emoji))
+    def _invalidate_configured_webhook(self, guild_id, channel_id):
+        # Only touch configs that are already cached, without skewing the cache's stats or order
+        config = self.get_webhook_config.cache.peek(guild_id)
+
+        # Pooled webhooks are left alone, since creating them fires this event too, and a deleted one is forgotten when it 404s
+        if config:
+            config.invalidate_webhook()
+
+    def get_guild_prefix(self, guild):
+        return (self.prefixes.get(guild.id) or [self.user.mention])[0]
 
-        return replaced, found
+    def get_guild_prefixes(self, guild):
+        return list(self.prefixes.get(guild.id, prefixes.DEFAULT_PREFIXES))
+
+    async def set_guild_prefixes(self, guild, prefixes):
+        # The store publishes the change once it's written, here and in every other process
+        await self.prefixes.set(guild.id, prefixes)
+
+    async def get_prefix(self, message):
+        # Skip the copy the default implementation makes, since the matcher's tuples are never changed
+        return get_prefix(self, message)
+
+    def replace_emojis(self, content):
+        return emojis.replace(content, self.emoji_index.get)
 
     def run(self):
         super().run(self.config.token)
 
-    async def logout(self):
+    async def close(self):
+        self.reposts.close()
+        self.shard_health.close()
+        await self.prefixes.close()
+        await self.emoji_directory.close()
+        await self.faked_messages.close()
+        await self.webhook_pool.close()
         await self.db.close()
         await self.session.close()
-        await super().logout()
+        await super().close()
 
     @discord.utils.cached_property
     def config(self):
         return __import__("config")
 
-EmoteWizard().run()
+if __name__ == "__main__":
+    EmoteWizard().run()
@@ -10,12 +10,14 @@ import time
 import traceback
 
 import discord
-import humanize
-import psutil
 from discord.ext import commands, tasks
-from jishaku import codeblocks
 
-from .utils import formats, menus
+from .utils import cache, converters, formats, imports
+
+# Only needed by rare commands, so they aren't imported until they are used
+humanize = imports.lazy("humanize")
+menus = imports.lazy("cogs.utils.menus")
+psutil = imports.lazy("psutil")
 
 log = logging.getLogger("robo_coder.admin")
 
@@ -136,8 +138,44 @@ class Admin(commands.Cog):
 
         await ctx.send(message)
 
+    @commands.command(name="imports", description="Profile how long modules take to import", aliases=["importtime"])
+    async def import_times(self, ctx, *modules):
+        modules = modules or [extension for extension in self.bot.extensions if extension.startswith("cogs.")]
+
+        # Seconds each module may take to import, counting everything it imports
+        budget = getattr(self.bot.config, "import_budget", None)
+
+        async with ctx.typing():
+            results = await asyncio.gather(*[imports.profile(module) for module in modules], return_exceptions=True)
+
+        table = formats.Tabulate()
+        table.add_columns(["module", "total", "heaviest imports"])
+
+        over = []
+        for module, times in zip(modules, results):
+            if isinstance(times, Exception):
+                table.add_row([module, "error", str(times)])
+                continue
+
+            total = next((time.cumulative for time in reversed(times) if time.module == module), 0)
+            if budget is not None and total > budget:
+                over.append(module)
+
+            heaviest = sorted(imports.dependencies(times, module), key=lambda time: time.cumulative, reverse=True)[:3]
+            table.add_row([
+                module,
+                f"{total*1000:.0f}ms",
+                ", ".join(f"{time.module} {time.cumulative*1000:.0f}ms" for time in heaviest)
+            ])
+
+        content = f"```{table}```"
+        if over:
+            content += f"\n:warning: Over the {budget*1000:.0f}ms budget: {', '.join(over)}"
+
+        await ctx.send(content)
+
     @commands.command(name="sql", description="Run some sql")
-    async def sql(self, ctx, *, code: codeblocks.codeblock_converter):
+    async def sql(self, ctx, *, code: converters.CodeblockConverter):
         _, query = code
 
         execute = query.count(";") > 1
@@ -185,6 +223,97 @@ class Admin(commands.Cog):
         disk = psutil.disk_usage("/")
         em.add_field(name="Disk", value=f"{humanize.naturalsize(disk.used)}/{humanize.naturalsize(disk.total)} ({disk.percent}% used)")
 
+        em.add_field(
+            name="Startup",
+            value=", ".join(f"{stage} {seconds*1000:.0f}ms" for stage, seconds in self.bot.startup.items()),
+            inline=False
+        )
+
+        shards = await self.bot.shard_health.fetch()
+        if shards:
+            healthy = []
+            unhealthy = []
+
+            for record, stale in shards:
+                if stale:
+                    status = "not reporting"
+                elif record["closed"]:
+                    status = "disconnected"
+                elif record["latency"] is None:
+                    status = "no heartbeat"
+                else:
+                    status = f"{record['latency']*1000:.0f}ms"
+
+                line = f"Shard {record['shard_id']} (cluster {record['cluster_id']}): {status}, {formats.plural(record['guilds']):guild}"
+                (healthy if status.endswith("ms") else unhealthy).append(line)
+
+            # Keep the field under the embed limit on big clusters by only listing unhealthy shards
+            lines = unhealthy + healthy if len(shards) <= 15 else unhealthy[:15] + [f"{len(healthy)} other shards healthy"]
+            em.add_field(name=f"Shards (this is cluster {self.bot.cluster_id})", value="\n".join(lines), inline=False)
+
+        reposts = self.bot.reposts
+        em.add_field(
+            name="Repost Queues",
+            value=f"{reposts.depth} queued in {formats.plural(reposts.active):guild} (max {reposts.max_depth})\n"
+                  f"{reposts.completed}/{reposts.submitted} completed, {reposts.failed} failed\n"
+                  f"Wait p50 {reposts.wait_percentile(0.5)*1000:.0f}ms, p99 {reposts.wait_percentile(0.99)*1000:.0f}ms",
+            inline=False
+        )
+
+        executor = self.bot.repost_executor
+        em.add_field(
+            name="Repost Latency",
+            value="\n".join(
+                f"{stage}: p50 {executor.percentile(stage, 0.5)*1000:.0f}ms, p99 {executor.percentile(stage, 0.99)*1000:.0f}ms"
+                for stage in executor.STAGES
+            ),
+            inline=False
+        )
+
+        limiter = self.bot.rate_limiter
+        em.add_field(name="Rate Limits", value=f"{limiter.delayed} delayed, {limiter.shed} shed to the bot account", inline=False)
+
+        directory = self.bot.emoji_directory
+        em.add_field(
+            name="Emoji Directory",
+            value=f"{len(self.bot.emoji_index)} emojis indexed\n{directory.synced} rows written, {directory.reloaded} guild reloads",
+            inline=False
+        )
+
+        store = self.bot.faked_messages
+        em.add_field(
+            name="Faked Messages",
+            value=f"{len(store)} in memory ({humanize.naturalsize(store.memory())})\n"
+                  f"{store.evicted_size} evicted for size, {store.evicted_age} for age\n"
+                  f"{store.hits} memory hits, {store.database_hits} database hits, {store.misses} misses, {store.flushed} written",
+            inline=False
+        )
+
+        for name, lru in cache.caches.items():
+            lookups = lru.hits + lru.misses
+            em.add_field(
+                name=f"Cache: {name}",
+                value=f"{len(lru)}/{lru.max_length} entries\n"
+                      f"{lru.hits} hits, {lru.misses} misses ({lru.hits/lookups if lookups else 0:.1%} hit rate)\n"
+                      f"{lru.evictions} evictions, {lru.expirations} expirations",
+                inline=False
+            )
+
+        published = self.bot.invalidation.published
+        if published:
+            em.add_field(name="Invalidations", value="\n".join(f"{topic}: {count}" for topic, count in published.most_common()), inline=False)
+
+        emojis = self.bot.get_cog("Emojis")
+        if emojis and emojis.triage["received"]:
+            triage = emojis.triage
+            rejected = triage["received"] - triage["replaced"]
+            stages = "\n".join(f"{stage}: {triage[stage]}" for stage in ("bot", "ignored", "no_delimiters", "no_emojis", "command"))
+            em.add_field(
+                name="Message Triage",
+                value=f"{rejected}/{triage['received']} rejected ({rejected/triage['received']:.1%})\n{stages}",
+                inline=False
+            )
+
         await ctx.send(embed=em)
 
     @commands.command(name="logout", description="Logs out the bot")
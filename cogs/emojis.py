@@ -1,14 +1,15 @@
 import discord
 from discord.ext import commands
-from discord.ext import menus
 
 import asyncio
+import collections
 import re
 import typing
-from io import BytesIO
 
-from .utils.menus import Confirm
-from .utils import checks, converters, faked
+from .utils import checks, converters, imports
+
+# Only needed by rare commands, so discord-ext-menus isn't imported until they are used
+menus = imports.lazy("cogs.utils.menus")
 
 def finder(text, collection, *, key=None, lazy=True):
     suggestions = []
@@ -31,101 +32,86 @@ def finder(text, collection, *, key=None, lazy=True):
     else:
         return [z for _, _, z in sorted(suggestions, key=sort_key)]
 
-class EmojiPages(menus.ListPageSource):
-    def __init__(self, data):
-        self.data = data
-        super().__init__(data, per_page=10)
-
-    async def format_page(self, menu, entries):
-        offset = menu.current_page * self.per_page
-        em = discord.Embed(description="", color=discord.Color.blurple())
-        for i, v in enumerate(entries, start=offset):
-            em.description += f"\n{v[1]} {v[0]}"
-        em.set_footer(text=f"{len(self.data)} emojis | Page {menu.current_page+1}/{int(len(self.data)/10)+1}")
-
-        return em
-
 class Emojis(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
+        # Counts how many messages each triage stage rejected
+        self.triage = collections.Counter()
+
     @commands.Cog.listener()
     async def on_message(self, message):
-        context = await self.bot.get_context(message)
+        self.triage["received"] += 1
+
+        # Run the cheapest checks first, so most messages never build a context
+        if message.author.bot:
+            self.triage["bot"] += 1
+            return
 
-        if message.author.bot or self.bot.config.ignore or context.valid:
+        if self.bot.config.ignore:
+            self.triage["ignored"] += 1
+            return
+
+        if ";" not in message.content and ":" not in message.content:
+            self.triage["no_delimiters"] += 1
             return
 
         replaced_content, found = self.bot.replace_emojis(message.content)
 
         if len(found) == 0:
+            self.triage["no_emojis"] += 1
             return
 
-        # If we don't have permissions just skip everything else and send it through the bot now
-        if isinstance(message.channel, discord.DMChannel) or not (message.guild.me.guild_permissions.manage_messages and message.guild.me.guild_permissions.manage_webhooks):
-            return await message.channel.send(" ".join(found))
+        context = await self.bot.get_context(message)
 
-        config = await self.bot.get_webhook_config(message.guild)
-        webhook = await config.webhook()
+        if context.valid:
+            self.triage["command"] += 1
+            return
 
-        # If a webhook is configured, send it through the webhook
-        if webhook:
-            if webhook.channel != message.channel:
-                await webhook.edit(channel=message.channel)
-
-            files = [
-                discord.File(
-                    BytesIO(await x.read()),
-                    filename=x.filename,
-                    spoiler=x.is_spoiler()
-                )
-            for x in message.attachments]
-
-            replacement = await webhook.send(
-                content=discord.utils.escape_mentions(replaced_content),
-                files=files,
-                username=message.author.display_name,
-                avatar_url=message.author.display_avatar.url,
-                wait=True
-            )
+        self.triage["replaced"] += 1
 
-            self.bot.faked_messages[replacement.id] = faked.FakedMessage(
-                original=message,
-                replacement=replacement
-            )
+        # If we don't have permissions just skip everything else and send it through the bot now
+        if isinstance(message.channel, discord.DMChannel) or not (message.guild.me.guild_permissions.manage_messages and message.guild.me.guild_permissions.manage_webhooks):
+            return await message.channel.send(" ".join(found))
 
-            await message.delete()
+        replacement = await self.bot.repost_executor.repost(
+            message,
+            content=discord.utils.escape_mentions(replaced_content),
+            attachments=message.attachments
+        )
 
-        # Otherwise just send the found emojis through the bot account
-        else:
+        # If no webhook is configured or the attachments couldn't be forwarded, just send the found emojis through the bot account
+        if not replacement:
             return await message.channel.send(" ".join(found))
 
     @commands.Cog.listener()
-    async def on_reaction_add(self, reaction, user):
-        faked = self.bot.faked_messages.get(reaction.message.id)
+    async def on_raw_reaction_add(self, payload):
+        # Raw events fire even when the message isn't cached, so check the cheap things first
+        emoji = str(payload.emoji)
+        if not payload.guild_id or emoji not in ("\N{CROSS MARK}", "\N{MEMO}", "\N{PENCIL}\N{VARIATION SELECTOR-16}"):
+            return
 
-        if not faked or faked.original.author != user:
+        faked = await self.bot.faked_messages.fetch(payload.message_id)
+
+        if not faked or faked.author_id != payload.user_id:
             return
 
-        if reaction.emoji == "\N{CROSS MARK}" and reaction.message.guild.me.guild_permissions.manage_messages:
-            await faked.replacement.delete()
-            self.bot.faked_messages.pop(reaction.message.id)
+        guild = self.bot.get_guild(payload.guild_id)
+        user = payload.member
+
+        if emoji == "\N{CROSS MARK}" and guild.me.guild_permissions.manage_messages:
+            await faked.delete(self.bot)
+            self.bot.faked_messages.remove(payload.message_id)
 
-        elif (reaction.emoji == "\N{MEMO}" or reaction.emoji == "\N{PENCIL}\N{VARIATION SELECTOR-16}") and reaction.message.guild.me.guild_permissions.manage_webhooks:
-            await reaction.remove(user)
+        elif emoji != "\N{CROSS MARK}" and guild.me.guild_permissions.manage_webhooks:
+            channel = guild.get_channel_or_thread(payload.channel_id)
+            await channel.get_partial_message(payload.message_id).remove_reaction(payload.emoji, user)
 
             await user.send("What would you like to edit your message to?")
             message = await self.bot.wait_for("message", check=lambda message: message.channel == user.dm_channel and message.author == user)
-            content = message.content
 
-            if faked.reply:
-                await faked.replacement.edit(
-                    content=faked.reply.format_with(content),
-                    allowed_mentions=faked.reply.allowed_mentions
-                )
-            elif not faked.is_sticker:
-                formatted_content, _ = self.bot.replace_emojis(content)
-                await faked.replacement.edit(content=formatted_content)
+            if not faked.is_sticker:
+                await faked.edit(self.bot, message.content)
 
             await message.add_reaction("\N{WHITE HEAVY CHECK MARK}")
 
@@ -137,23 +123,17 @@ class Emojis(commands.Cog):
         except discord.HTTPException:
             pass
 
-        faked = self.bot.faked_messages.get(message.id)
+        faked = await self.bot.faked_messages.fetch(message.id)
 
         if not faked:
             return await ctx.send(":x: This message cannot be edited", delete_after=5)
-        elif faked.original.author != ctx.author:
+        elif faked.author_id != ctx.author.id:
             return await ctx.send(":x: You are not the author of this message", delete_after=5)
 
-        if faked.reply:
-            await faked.replacement.edit(
-                content=faked.reply.format_with(content),
-                allowed_mentions=faked.reply.allowed_mentions
-            )
-        elif faked.is_sticker:
+        if faked.is_sticker:
             return await ctx.send(":x: Stickers cannot be edited", delete_after=5)
-        else:
-            formatted_content, _ = self.bot.replace_emojis(content)
-            await faked.replacement.edit(content=formatted_content)
+
+        await faked.edit(self.bot, content)
 
     @commands.hybrid_command(name="delete", description="Delete a reposted message")
     @commands.guild_only()
@@ -161,15 +141,15 @@ class Emojis(commands.Cog):
     async def delete(self, ctx, message: discord.Message):
         await ctx.message.delete()
 
-        faked = self.bot.faked_messages.get(message.id)
+        faked = await self.bot.faked_messages.fetch(message.id)
 
         if not faked:
             return await ctx.send(":x: This message cannot be deleted", delete_after=5)
-        if faked.original.author != ctx.author:
+        if faked.author_id != ctx.author.id:
             return await ctx.send(":x: You are not the author of this message", delete_after=5)
 
-        await faked.replacement.delete()
-        self.bot.faked_messages.pop(message.id)
+        await faked.delete(self.bot)
+        self.bot.faked_messages.remove(message.id)
 
     @commands.hybrid_group(name="webhook", description="View the current webhook for the server", invoke_without_command=True, fallback="show")
     @commands.guild_only()
@@ -190,7 +170,7 @@ class Emojis(commands.Cog):
     @commands.bot_has_permissions(manage_webhooks=True)
     async def webhook_set(self, ctx, *, webhook: converters.WebhookConverter):
         config = await self.bot.get_webhook_config(ctx.guild)
-        if await config.webhook() and not await Confirm("A webhook is already set. Would you like to override it?").prompt(ctx):
+        if await config.webhook() and not await menus.Confirm("A webhook is already set. Would you like to override it?").prompt(ctx):
             return await ctx.send("Aborting")
 
         await config.set_webhook(webhook)
@@ -202,7 +182,7 @@ class Emojis(commands.Cog):
     @commands.bot_has_permissions(manage_webhooks=True)
     async def webhook_create(self, ctx):
         config = await self.bot.get_webhook_config(ctx.guild)
-        if await config.webhook() and not await Confirm("A webhook is already set. Would you like to override it?").prompt(ctx):
+        if await config.webhook() and not await menus.Confirm("A webhook is already set. Would you like to override it?").prompt(ctx):
             return await ctx.send("Aborting")
 
         try:
@@ -222,10 +202,14 @@ class Emojis(commands.Cog):
     @commands.bot_has_permissions(manage_webhooks=True)
     async def webhook_unbind(self, ctx):
         config = await self.bot.get_webhook_config(ctx.guild)
-        if  await config.webhook() and not await Confirm("Are you sure you want to unbind the webhook?").prompt(ctx):
+        if  await config.webhook() and not await menus.Confirm("Are you sure you want to unbind the webhook?").prompt(ctx):
             return await ctx.send("Aborting")
 
         await config.set_webhook(None)
+
+        # Reposting is off now, so remove the webhooks the bot made in each channel
+        await self.bot.webhook_pool.delete_guild(ctx.guild)
+
         await ctx.send(":white_check_mark: Unbound webhook")
 
     @commands.hybrid_command(name="react", descrition="React to a message with any emoji")
@@ -267,17 +251,13 @@ class Emojis(commands.Cog):
 
     @emoji.command(name="search", description="Search for emojis by name", aliases=["find"])
     async def emoji_search(self, ctx, search):
-        results = finder(
-            search,
-            [(emoji.name, str(emoji)) for emoji in self.bot.emojis],
-            key=lambda t: t[0],
-            lazy=False
-        )
+        emojis, total = self.bot.emoji_index.search(search, limit=250, with_total=True)
+        results = [(emoji.name, str(emoji)) for emoji in emojis]
 
         if len(results) == 0:
             return await ctx.send(":x: No results found")
 
-        pages = menus.MenuPages(source=EmojiPages(results), clear_reactions_after=True)
+        pages = menus.MenuPages(source=menus.EmojiPages(results, total=total), clear_reactions_after=True)
         await pages.start(ctx)
 
 async def setup(bot):
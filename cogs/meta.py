@@ -6,9 +6,12 @@ import sys
 import json
 import asyncio
 import datetime
-import humanize
 
-from .utils import formats, menus
+from .utils import formats, imports
+
+# Only needed by rare commands, so they aren't imported until they are used
+humanize = imports.lazy("humanize")
+menus = imports.lazy("cogs.utils.menus")
 
 class Prefix(commands.Converter):
     async def convert(self, ctx, prefix):
@@ -101,7 +104,7 @@ class Meta(commands.Cog):
             return await ctx.send(":x: You cannot have more than 10 custom prefixes")
 
         prefixes.append(prefix)
-        await self.bot.prefixes.add(ctx.guild.id, prefixes)
+        await self.bot.set_guild_prefixes(ctx.guild, prefixes)
 
         await ctx.send(f":white_check_mark: Added the prefix `{prefix}`")
 
@@ -113,7 +116,7 @@ class Meta(commands.Cog):
             return await ctx.send(":x: That prefix is not added")
 
         prefixes.remove(prefix)
-        await self.bot.prefixes.add(ctx.guild.id, prefixes)
+        await self.bot.set_guild_prefixes(ctx.guild, prefixes)
 
         await ctx.send(f":white_check_mark: Removed the prefix `{prefix}`")
 
@@ -128,7 +131,7 @@ class Meta(commands.Cog):
             return await ctx.send(":x: You cannot have more than 10 prefixes")
 
         prefixes = [prefix] + prefixes
-        await self.bot.prefixes.add(ctx.guild.id, prefixes)
+        await self.bot.set_guild_prefixes(ctx.guild, prefixes)
 
         await ctx.send(f":white_check_mark: Set `{prefix}` as the default prefix")
 
@@ -139,12 +142,12 @@ class Meta(commands.Cog):
         if not result:
             return await ctx.send("Aborting")
 
-        await self.bot.prefixes.add(ctx.guild.id, [])
+        await self.bot.set_guild_prefixes(ctx.guild, [])
         await ctx.send(f":white_check_mark: Removed all prefixes")
 
     @prefix.command(name="list", description="View the prefixes in this server")
     async def prefix_list(self, ctx):
-        prefixes = await self.bot.get_prefix(ctx.message)
+        prefixes = list(await self.bot.get_prefix(ctx.message))
         prefixes.pop(0)
 
         em = discord.Embed(title="Prefixes", description="\n".join(prefixes), color=0x96c8da)
@@ -3,11 +3,14 @@ from discord.ext import commands
 
 import functools
 import io
-import datetime
 import typing
-from PIL import Image, ImageDraw, ImageOps
 
-from .utils import checks, converters, faked, formats
+from .utils import checks, converters, faked, formats, imports
+
+# Only needed to make avatar emojis, so Pillow isn't imported until one is made
+Image = imports.lazy("PIL.Image")
+ImageDraw = imports.lazy("PIL.ImageDraw")
+ImageOps = imports.lazy("PIL.ImageOps")
 
 class Replies(commands.Cog):
     def __init__(self, bot):
@@ -31,96 +34,37 @@ class Replies(commands.Cog):
         if not webhook:
             return await ctx.send(":x: No webhook is set")
 
-        # Fetch emoji
-        emoji = self.bot.avatar_emojis.get(message.author.id)
+        avatars = self.bot.avatar_emojis
+        emoji = await avatars.get(message.author.id)
 
         # If the emoji does not exist or the emoji is an outdated avatar, make a new emoji
-        if not emoji or emoji["avatar_url"] != message.author.display_avatar.url or not self.bot.get_emoji(emoji["emoji_id"]):
-            # If the emoji is outdated, delete it
-            if emoji and emoji["avatar_url"] != message.author.display_avatar.url:
-                emoji = self.bot.get_emoji(emoji["emoji_id"])
-                await emoji.delete()
-
-            # If the emoji slots are full, remove the oldest used one
-            if len(self.bot.guild.emojis) >= 50:
-                emojis = self.bot.avatar_emojis.values()
-                emojis = sorted(emojis, key = lambda x: x["last_used"])
-                to_delete = emojis[0]
-                await to_delete.delete()
-
-                # Remove emoji from database
-                query = """DELETE FROM avatar_emojis
-                           WHERE avatar_emojis.emoji_id=$1;
-                        """
-                await self.bot.db.execute(query, to_delete.id)
-
-                # Pop the emoji out of the cache
-                for emoji in self.bot.avatar_emojis:
-                    if emoji["emoij_id"] == to_delete.id:
-                        self.bot.avatar_emojis.pop(emoji["user_id"])
+        if not emoji or avatars.is_outdated(emoji, message.author):
+            if emoji:
+                await avatars.delete(emoji)
 
+            # If the emoji slots are full, remove the oldest used ones
+            await avatars.make_room()
             emoji = await self.create_avatar_emoji(message.author)
 
-            # Update/insert a row
-            query = """INSERT INTO avatar_emojis (user_id, emoji_id, avatar_url)
-                       VALUES ($1, $2, $3)
-                       ON CONFLICT (user_id)
-                       DO UPDATE SET emoji_id=$2, avatar_url=$3, last_used=$4;
-                    """
-            await self.bot.db.execute(
-                query,
-                message.author.id,
-                emoji.id,
-                message.author.display_avatar.url,
-                datetime.datetime.utcnow()
-            )
-
-            # Update cache
-            self.bot.avatar_emojis[message.author.id] = {
-                "user_id": ctx.author.id,
-                "emoji_id": emoji.id,
-                "avatar_url": message.author.display_avatar.url,
-                "last_used": datetime.datetime.utcnow()
-            }
-
-        # Otherwise just fetch the emoji and update the row
+        # Otherwise just update when it was last used
         else:
-            emoji = self.bot.get_emoji(emoji["emoji_id"])
-
-            # Update the last used
-            query = """UPDATE avatar_emojis
-                       SET last_used=$1
-                       WHERE avatar_emojis.user_id=$2;
-                    """
-            await self.bot.db.execute(query, datetime.datetime.utcnow(), message.author.id)
-
-            # Update cache
-            self.bot.avatar_emojis[message.author.id]["last_used"] = datetime.datetime.utcnow()
+            await avatars.touch(message.author.id)
 
         # Prepare content
         reply = faked.Reply(bot=self.bot, quote=message, emoji=emoji, mention=mention)
         formatted_content, _ = self.bot.replace_emojis(reply.format_with(content))
 
-        await ctx.message.delete()
-
-        # Update webhook if needed
-        if webhook.channel != ctx.channel:
-            await webhook.edit(channel=ctx.channel)
-
-        replacement = await webhook.send(
+        replacement = await self.bot.repost_executor.repost(
+            ctx.message,
             content=formatted_content,
-            username=ctx.author.display_name,
-            avatar_url=ctx.author.display_avatar.url,
             allowed_mentions=reply.allowed_mentions,
-            wait=True
-        )
-
-        self.bot.faked_messages[replacement.id] = faked.FakedMessage(
-            original=ctx.message,
-            replacement=replacement,
             reply=reply
         )
 
+        # If the webhook is gone or rate limited, post the reply through the bot account instead
+        if not replacement:
+            return await ctx.send(formatted_content, allowed_mentions=reply.allowed_mentions)
+
     async def create_avatar_emoji(self, user):
         avatar = io.BytesIO(await user.display_avatar.with_format("png").read())
         avatar = Image.open(avatar).convert("RGBA")
@@ -128,7 +72,7 @@ class Replies(commands.Cog):
         partial = functools.partial(self.round_avatar, avatar)
         avatar = await self.bot.loop.run_in_executor(None, partial)
 
-        return await self.bot.guild.create_custom_emoji(name=f"user_{user.id}", image=avatar.read())
+        return await self.bot.avatar_emojis.create(user, avatar.read())
 
     def round_avatar(self, avatar):
         mask = Image.new("L", (128, 128), 0)
@@ -5,8 +5,6 @@ from discord.ext import commands
 import asyncpg
 import os
 
-from .utils import faked
-
 class Stickers(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
@@ -26,29 +24,14 @@ class Stickers(commands.Cog):
         if ctx.interaction or isinstance(ctx.channel, discord.DMChannel) or not (ctx.me.guild_permissions.manage_messages and ctx.me.guild_permissions.manage_webhooks):
             return await ctx.send(file=discord.File(sticker["content_path"]))
 
-        config = await self.bot.get_webhook_config(ctx.guild)
-        webhook = await config.webhook()
-
-        if webhook:
-            if webhook.channel != ctx.channel:
-                await webhook.edit(channel=ctx.channel)
-
-            replacement = await webhook.send(
-                file=discord.File(sticker["content_path"]),
-                username=ctx.author.display_name,
-                avatar_url=ctx.author.display_avatar.url,
-                wait=True
-            )
-
-            self.bot.faked_messages[replacement.id] = faked.FakedMessage(
-                original=ctx.message,
-                replacement=replacement,
-                is_sticker=True
-            )
-
-            await ctx.message.delete()
-        else:
-            await ctx.send(file=discord.File(sticker["content_path"]))
+        replacement = await self.bot.repost_executor.repost(
+            ctx.message,
+            files=[discord.File(sticker["content_path"])],
+            is_sticker=True
+        )
+
+        if not replacement:
+            return await ctx.send(file=discord.File(sticker["content_path"]))
 
     @sticker.command(name="create", description="Create a sticker", aliases=["add", "new"])
     async def sticker_create(self, ctx, name, attachment: discord.Attachment):
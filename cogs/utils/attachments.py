@@ -0,0 +1,107 @@
+import discord
+
+import asyncio
+import contextlib
+from io import BytesIO
+
+class AttachmentForwarder:
+    """Downloads attachments for reposting within a shared memory budget.
+
+    Attachments are downloaded concurrently once there is room in the budget
+    of bytes currently held for other reposts, waiting up to timeout seconds
+    for it. A message is reposted with all of its attachments or not at all,
+    since deleting the original deletes its attachments too.
+    """
+
+    def __init__(self, *, budget=128 * 1024 * 1024, timeout=5.0):
+        self.budget = budget
+        self.timeout = timeout
+        self.in_flight = 0
+
+        # Reservations waiting for bytes to be released
+        self._waiters = []
+
+        self.downloaded = 0
+        self.waited = 0
+        self.skipped = 0
+        self.failed = 0
+
+    async def _reserve(self, size):
+        if size > self.budget:
+            return False
+
+        if self.in_flight + size > self.budget:
+            self.waited += 1
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+
+        while self.in_flight + size > self.budget:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False
+
+            waiter = loop.create_future()
+            self._waiters.append(waiter)
+            try:
+                await asyncio.wait_for(waiter, timeout=remaining)
+            except asyncio.TimeoutError:
+                return False
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+
+        self.in_flight += size
+        return True
+
+    def _release(self, size):
+        self.in_flight -= size
+
+        # Wake everyone waiting, and the ones that still don't fit go back to waiting
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    @contextlib.asynccontextmanager
+    async def forward(self, attachments, *, limit=None):
+        """Downloads attachments and yields them as files, or None if they can't all be forwarded.
+
+        The bytes are held against the budget until the block exits.
+        """
+
+        if any(limit is not None and attachment.size > limit for attachment in attachments):
+            self.skipped += 1
+            yield None
+            return
+
+        size = sum(attachment.size for attachment in attachments)
+        if not await self._reserve(size):
+            self.skipped += 1
+            yield None
+            return
+
+        try:
+            data = await asyncio.gather(*[attachment.read() for attachment in attachments], return_exceptions=True)
+
+            for content in data:
+                if isinstance(content, discord.HTTPException):
+                    self.failed += 1
+                    yield None
+                    return
+                elif isinstance(content, BaseException):
+                    raise content
+
+            files = [
+                discord.File(
+                    BytesIO(content),
+                    filename=attachment.filename,
+                    spoiler=attachment.is_spoiler()
+                )
+            for attachment, content in zip(attachments, data)]
+
+            self.downloaded += len(files)
+
+            yield files
+        finally:
+            self._release(size)
@@ -0,0 +1,130 @@
+import discord
+
+import datetime
+
+class AvatarEmoji:
+    """Represents an emoji of a user's avatar in the bot's emoji guild."""
+
+    __slots__ = ("user_id", "emoji_id", "avatar_url", "last_used")
+
+    def __init__(self, record):
+        self.user_id = record["user_id"]
+        self.emoji_id = record["emoji_id"]
+        self.avatar_url = record["avatar_url"]
+        self.last_used = record["last_used"]
+
+    def __str__(self):
+        return f"<:user_{self.user_id}:{self.emoji_id}>"
+
+class AvatarEmojiStore:
+    """Represents the avatar emojis of users, stored in the database.
+
+    The emojis live in one guild, which is only connected to one process
+    when the bot runs as a cluster, so every process reads the rows and
+    talks to the guild over HTTP instead of keeping its own copy.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+
+        self._guild = None
+
+    async def guild(self):
+        """Gets the emoji guild, fetching it if it isn't connected to this process."""
+
+        guild = self.bot.get_guild(self.bot.config.guild)
+        if guild:
+            return guild
+
+        if not self._guild:
+            self._guild = await self.bot.fetch_guild(self.bot.config.guild)
+
+        return self._guild
+
+    async def get(self, user_id):
+        query = """SELECT *
+                   FROM avatar_emojis
+                   WHERE avatar_emojis.user_id=$1;
+                """
+        record = await self.bot.db.fetchrow(query, user_id)
+
+        return AvatarEmoji(record) if record else None
+
+    async def touch(self, user_id):
+        query = """UPDATE avatar_emojis
+                   SET last_used=$1
+                   WHERE avatar_emojis.user_id=$2;
+                """
+        await self.bot.db.execute(query, datetime.datetime.utcnow(), user_id)
+
+    async def save(self, user_id, emoji_id, avatar_url):
+        query = """INSERT INTO avatar_emojis (user_id, emoji_id, avatar_url, last_used)
+                   VALUES ($1, $2, $3, $4)
+                   ON CONFLICT (user_id)
+                   DO UPDATE SET emoji_id=$2, avatar_url=$3, last_used=$4;
+                """
+        await self.bot.db.execute(query, user_id, emoji_id, avatar_url, datetime.datetime.utcnow())
+
+    async def delete(self, avatar):
+        """Deletes an avatar emoji from the guild and the database."""
+
+        guild = await self.guild()
+        try:
+            await guild.delete_emoji(discord.Object(id=avatar.emoji_id))
+        except discord.NotFound:
+            pass
+
+        query = """DELETE FROM avatar_emojis
+                   WHERE avatar_emojis.emoji_id=$1;
+                """
+        await self.bot.db.execute(query, avatar.emoji_id)
+
+    async def make_room(self):
+        """Deletes the least recently used avatar emojis until the guild has a free slot for another."""
+
+        guild = self.bot.get_guild(self.bot.config.guild)
+        if guild and not guild.unavailable:
+            emojis = guild.emojis
+        else:
+            # A fetched guild's emojis are only as new as the fetch
+            guild = await self.guild()
+            emojis = await guild.fetch_emojis()
+
+        # Static and animated emojis have separate slots, and avatars are static
+        needed = sum(not emoji.animated for emoji in emojis) - guild.emoji_limit + 1
+        if needed <= 0:
+            return
+
+        query = """SELECT *
+                   FROM avatar_emojis
+                   ORDER BY avatar_emojis.last_used ASC
+                   LIMIT $1;
+                """
+        records = await self.bot.db.fetch(query, needed)
+
+        for record in records:
+            await self.delete(AvatarEmoji(record))
+
+    async def create(self, user, image):
+        """Creates an avatar emoji for a user from the image bytes and saves it."""
+
+        guild = await self.guild()
+        emoji = await guild.create_custom_emoji(name=f"user_{user.id}", image=image)
+        await self.save(user.id, emoji.id, user.display_avatar.url)
+
+        return AvatarEmoji({
+            "user_id": user.id,
+            "emoji_id": emoji.id,
+            "avatar_url": user.display_avatar.url,
+            "last_used": datetime.datetime.utcnow()
+        })
+
+    def is_outdated(self, avatar, user):
+        """Checks if an avatar emoji no longer matches the user's avatar or was deleted from the guild."""
+
+        if avatar.avatar_url != user.display_avatar.url:
+            return True
+
+        # Deleted emojis can only be noticed if the guild is connected to this process
+        guild = self.bot.get_guild(self.bot.config.guild)
+        return bool(guild) and not self.bot.get_emoji(avatar.emoji_id)
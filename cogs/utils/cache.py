@@ -2,48 +2,159 @@ import asyncio
 import functools
 import inspect
 import collections
+import time
+
+# Every cache made by the decorator, by the qualified name of the function
+caches = {}
 
 class LRUDict(collections.OrderedDict):
-    def __init__(self, max_legnth = 10, *args, **kwargs):
-        if max_legnth <= 0:
-            raise ValueError()
-        self.max_legnth = max_legnth
+    """Represents a dict that evicts its least recently used keys past max_length.
+
+    Entries can also expire ttl seconds after they were set.
+    """
+
+    def __init__(self, max_length=128, *args, ttl=None, **kwargs):
+        if max_length <= 0:
+            raise ValueError("max_length must be positive")
+        self.max_length = max_length
+        self.ttl = ttl
+
+        self._expires = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
 
         super().__init__(*args, **kwargs)
 
     def __setitem__(self, key, value):
         super().__setitem__(key, value)
+        self.move_to_end(key)
+
+        if self.ttl is not None:
+            self._expires[key] = time.monotonic() + self.ttl
 
-        if len(self) > 10:
-            super().__delitem__(list(self)[0])
+        while len(self) > self.max_length:
+            self.popitem(last=False)
+            self.evictions += 1
 
     def __getitem__(self, key):
-        value = super().__getitem__(key)
+        try:
+            value = super().__getitem__(key)
+        except KeyError:
+            self.misses += 1
+            raise
+
+        expires = self._expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            del self[key]
+            self.expirations += 1
+            self.misses += 1
+            raise KeyError(key)
+
         self.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._expires.pop(key, None)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def peek(self, key, default=None):
+        """Gets a key without counting a hit or miss or marking it as recently used."""
+
+        try:
+            value = super().__getitem__(key)
+        except KeyError:
+            return default
+
+        # Expired keys are left for the next lookup to remove and count
+        expires = self._expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            return default
+
         return value
 
-def cache(max_legnth = 128):
+    def pop(self, key, *args):
+        self._expires.pop(key, None)
+        return super().pop(key, *args)
+
+    def popitem(self, last=True):
+        key, value = super().popitem(last=last)
+        self._expires.pop(key, None)
+        return key, value
+
+    def clear(self):
+        super().clear()
+        self._expires.clear()
+
+def cache(max_length=128, *, ttl=None, key=None, ignore_self=True):
+    """Caches the results of a function.
+
+    Keys are built by key, which gets the same arguments as the function,
+    or by a tuple of the arguments by default. The self argument of methods
+    is left out unless ignore_self is False.
+    """
+
     def decorator(func):
-        cache = LRUDict(max_legnth=max_legnth)
+        cache = LRUDict(max_length=max_length, ttl=ttl)
+        caches[func.__qualname__] = cache
+
+        parameters = list(inspect.signature(func).parameters)
+        skip = 1 if ignore_self and parameters and parameters[0] == "self" else 0
+
+        # Loads that are in flight, so concurrent misses for a key share one
+        pending = {}
 
         def __len__():
             return len(cache)
 
         def _get_key(*args, **kwargs):
-            return f"{':'.join([repr(arg) for arg in args])}{':'.join([f'{repr(kwarg)}={repr(value)}' for kwarg, value in kwargs.items()])}"
+            args = args[skip:]
+
+            if key:
+                return key(*args, **kwargs)
+
+            result = (*args, *kwargs.items()) if kwargs else args
+            try:
+                hash(result)
+            except TypeError:
+                # Fall back to the repr for unhashable arguments
+                return repr(result)
+
+            return result
 
         def invalidate(*args, **kwargs):
             if not args:
                 cache.clear()
+                pending.clear()
                 return
 
+            return invalidate_key(_get_key(*args, **kwargs))
+
+        def invalidate_key(key):
+            # Don't let a load that started before this cache its stale result
+            pending.pop(key, None)
+
             try:
-                key = _get_key(*args, **kwargs)
                 cache.pop(key)
                 return True
             except KeyError:
                 return False
 
+        def _wait(task):
+            async def coro():
+                # Shield the load so one caller being cancelled doesn't cancel it for everyone
+                return await asyncio.shield(task)
+            return coro()
+
         @functools.wraps(func)
         def wrapped(*args, **kwargs):
             key = _get_key(*args, **kwargs)
@@ -57,19 +168,32 @@ def cache(max_legnth = 128):
                 return value
 
             except KeyError:
+                task = pending.get(key)
+                if task:
+                    return _wait(task)
+
                 value = func(*args, **kwargs)
                 if inspect.isawaitable(value):
-                    async def coro():
-                        result = await value
-                        cache[key] = result
-                        return result
-                    return coro()
+                    task = pending[key] = asyncio.ensure_future(value)
+
+                    def done(task):
+                        if pending.get(key) is not task:
+                            return
+                        del pending[key]
+
+                        # Exceptions reach every waiter through the task and are never cached
+                        if not task.cancelled() and task.exception() is None:
+                            cache[key] = task.result()
+
+                    task.add_done_callback(done)
+                    return _wait(task)
 
                 cache[key] = value
                 return value
 
 
         wrapped.invalidate = invalidate
+        wrapped.invalidate_key = invalidate_key
         wrapped.cache = cache
         wrapped._get_key = _get_key
         wrapped.__len__ = __len__
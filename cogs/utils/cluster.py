@@ -0,0 +1,71 @@
+import asyncio
+import collections
+import datetime
+import logging
+import math
+
+log = logging.getLogger("emote_wizard.cluster")
+
+class ShardHealth:
+    """Represents the health of every shard in the cluster, shared through the database.
+
+    Each process writes a row for each of its shards every interval seconds,
+    so any process can show the whole cluster. Rows that haven't been written
+    for a few intervals belong to a process that is down or stuck.
+    """
+
+    def __init__(self, bot, *, interval=30):
+        self.bot = bot
+        self.interval = interval
+
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._report_loop())
+
+    async def _report_loop(self):
+        await self.bot.wait_until_ready()
+
+        while True:
+            try:
+                await self.report()
+            except Exception as exc:
+                log.warning(f"Couldn't report shard health: {exc}")
+
+            await asyncio.sleep(self.interval)
+
+    async def report(self):
+        """Writes the current health of this process's shards."""
+
+        guilds = collections.Counter(guild.shard_id for guild in self.bot.guilds)
+        now = datetime.datetime.utcnow()
+
+        rows = []
+        for shard_id, shard in self.bot.shards.items():
+            # The latency is infinite or NaN until the first heartbeat is acknowledged
+            latency = shard.latency if math.isfinite(shard.latency) else None
+            rows.append((shard_id, self.bot.cluster_id, latency, shard.is_closed(), guilds[shard_id], now))
+
+        query = """INSERT INTO shard_health (shard_id, cluster_id, latency, closed, guilds, updated_at)
+                   VALUES ($1, $2, $3, $4, $5, $6)
+                   ON CONFLICT (shard_id) DO UPDATE
+                   SET cluster_id=$2, latency=$3, closed=$4, guilds=$5, updated_at=$6;
+                """
+        await self.bot.db.executemany(query, rows)
+
+    async def fetch(self):
+        """Gets the health of every shard in the cluster, with a flag for rows that are out of date."""
+
+        query = """SELECT *
+                   FROM shard_health
+                   WHERE shard_health.shard_id < $1
+                   ORDER BY shard_health.shard_id;
+                """
+        records = await self.bot.db.fetch(query, self.bot.shard_count)
+
+        expired = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.interval * 3)
+        return [(record, record["updated_at"] < expired) for record in records]
+
+    def close(self):
+        if self._task:
+            self._task.cancel()
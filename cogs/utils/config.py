@@ -1,15 +1,30 @@
 import asyncio
 import json
+import logging
 import os
 import itertools
+import tempfile
+
+log = logging.getLogger("emote_wizard.config")
 
 class Config:
-    """Represents a configuration file."""
+    """Represents a configuration file.
+
+    If delay is set, changes are written in the background at most once
+    every delay seconds instead of on every change, so rapid changes are
+    merged into one write. Writes always go to a temporary file that is
+    renamed over the old one, so a crash can't leave a half written file.
+    """
 
-    def __init__(self, filename):
+    def __init__(self, filename, *, delay=None):
         self.filename = filename
+        self.delay = delay
         self.lock = asyncio.Lock()
 
+        self._dirty = False
+        self._flusher = None
+        self._writing = asyncio.Lock()
+
         self.load()
 
     def load(self):
@@ -21,11 +36,70 @@ class Config:
         else:
             self.data = {}
 
+    def _write(self, content):
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        fd, temp = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+
+        try:
+            with os.fdopen(fd, "w") as file:
+                file.write(content)
+                file.flush()
+                os.fsync(file.fileno())
+
+            os.replace(temp, self.filename)
+        except BaseException:
+            os.unlink(temp)
+            raise
+
     def dump(self):
         """Dumps the data into the file."""
 
-        with open(self.filename, "w") as file:
-            json.dump(self.data, file)
+        self._dirty = False
+        self._write(json.dumps(self.data))
+
+    def _changed(self):
+        if self.delay is None:
+            self.dump()
+            return
+
+        self._dirty = True
+
+        # Changes made before the write starts are merged into it
+        if not self._flusher or self._flusher.done():
+            self._flusher = asyncio.ensure_future(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.delay)
+
+        try:
+            await self.flush()
+        except Exception as exc:
+            log.warning(f"Couldn't write {self.filename}: {exc}")
+
+    async def flush(self):
+        """Writes any unwritten changes to the file without blocking the event loop."""
+
+        async with self._writing:
+            if not self._dirty:
+                return
+
+            # Serialize on the loop so the data can't change while it's being written
+            content = json.dumps(self.data)
+            self._dirty = False
+
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self._write, content)
+            except BaseException:
+                self._dirty = True
+                raise
+
+    async def close(self):
+        """Stops waiting to write and writes any unwritten changes."""
+
+        if self._flusher:
+            self._flusher.cancel()
+
+        await self.flush()
 
     async def add(self, key, value):
         """Safely add adds a key."""
@@ -33,7 +107,7 @@ class Config:
         # Use lock to insure that we don't modify the file twice at the same time
         async with self.lock:
             self.data[str(key)] = value
-            self.dump()
+            self._changed()
 
     async def remove(self, key):
         """Safely removes a key."""
@@ -41,7 +115,7 @@ class Config:
         # Use lock to insure that we don't modify the file twice at the same time
         async with self.lock:
             del self.data[str(key)]
-            self.dump()
+            self._changed()
 
     def get(self, key, default=None):
         """Gets an item from the data."""
@@ -53,11 +127,11 @@ class Config:
 
     def __setitem__(self, key, value):
         self.data[str(key)] = value
-        self.dump()
+        self._changed()
 
-    def __delitem__(self, key, value):
+    def __delitem__(self, key):
         del self.data[str(key)]
-        self.dump()
+        self._changed()
 
     def __iter__(self):
         return self.data.__iter__()
@@ -81,7 +81,13 @@ class WebhookConverter(commands.Converter):
 
 class CustomEmojiConverter(commands.Converter):
     async def convert(self, ctx, arg):
-        emoji = discord.utils.get(ctx.bot.emojis, name=arg)
+        emoji = ctx.bot.emoji_index.get(arg)
         if not emoji:
             raise commands.errors.BadArgument(f"I couldn't find the emoji `{arg}`")
         return emoji
+
+class CodeblockConverter(commands.Converter):
+    async def convert(self, ctx, arg):
+        # Imported here so jishaku is only needed when a codeblock is converted
+        from jishaku.codeblocks import codeblock_converter
+        return codeblock_converter(arg)
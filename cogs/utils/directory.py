@@ -0,0 +1,216 @@
+import discord
+
+import asyncio
+import collections
+import logging
+
+from . import notifications
+
+log = logging.getLogger("emote_wizard.directory")
+
+class EmojiDirectory:
+    """Represents the emojis of every guild in the cluster, stored in the database.
+
+    Each process writes the emojis of the guilds on its own shards and
+    notifies the others with the IDs of the guilds that changed. Every
+    process keeps an index of every available emoji, loaded from the table
+    and refreshed for the guilds in each notification, so emojis resolve
+    the same way no matter which shard a message arrives on.
+    """
+
+    CHANNEL = "emoji_directory"
+
+    # Guild IDs per notification, which keeps payloads under Postgres' 8000 byte limit
+    CHUNK_SIZE = 350
+
+    def __init__(self, bot, index, *, delay=0.5):
+        self.bot = bot
+        self.index = index
+        self.delay = delay
+
+        self._listener = notifications.Listener(bot.config.sql, self.CHANNEL, self._notified, on_reconnect=self.load)
+
+        # Guilds to reload, gathered for delay seconds so a burst of notifications costs one query
+        self._stale = set()
+        self._reloader = None
+
+        self.synced = 0
+        self.reloaded = 0
+
+    @staticmethod
+    def _rows(emojis):
+        return [(emoji.id, emoji.name, emoji.animated, emoji.guild_id, emoji.available) for emoji in emojis]
+
+    @staticmethod
+    def _partial(record):
+        return discord.PartialEmoji(name=record["name"], id=record["id"], animated=record["animated"])
+
+    async def start(self):
+        """Starts listening for changes and loads the whole directory."""
+
+        # Listen before loading so no change made in between is missed
+        await self._listener.start()
+        await self.load()
+
+    async def load(self):
+        """Loads every available emoji into the index."""
+
+        query = """SELECT id, name, animated, guild_id
+                   FROM emoji_directory
+                   WHERE emoji_directory.available;
+                """
+        records = await self.bot.db.fetch(query)
+
+        guilds = collections.defaultdict(list)
+        for record in records:
+            guilds[record["guild_id"]].append(self._partial(record))
+
+        self.index.clear()
+        for guild_id, emojis in guilds.items():
+            self.index.update_guild(guild_id, emojis)
+
+    def _notified(self, payload):
+        self._stale.update(int(guild_id) for guild_id in payload.split(","))
+
+        if not self._reloader or self._reloader.done():
+            self._reloader = asyncio.create_task(self._reload_later())
+
+    async def _reload_later(self):
+        # Keep going while notifications arrive during a reload
+        while self._stale:
+            await asyncio.sleep(self.delay)
+
+            guild_ids, self._stale = list(self._stale), set()
+
+            try:
+                await self.reload(guild_ids)
+            except Exception as exc:
+                # Try them again with the next notification
+                self._stale.update(guild_ids)
+                log.warning(f"Couldn't reload the emojis of {len(guild_ids)} guilds: {exc}")
+                return
+
+    async def reload(self, guild_ids):
+        """Loads the emojis of some guilds into the index."""
+
+        query = """SELECT id, name, animated, guild_id
+                   FROM emoji_directory
+                   WHERE emoji_directory.guild_id=ANY($1) AND emoji_directory.available;
+                """
+        records = await self.bot.db.fetch(query, guild_ids)
+
+        guilds = {guild_id: [] for guild_id in guild_ids}
+        for record in records:
+            guilds[record["guild_id"]].append(self._partial(record))
+
+        for guild_id, emojis in guilds.items():
+            self.index.update_guild(guild_id, emojis)
+
+        self.reloaded += len(guild_ids)
+
+    async def _notify(self, conn, guild_ids):
+        for start in range(0, len(guild_ids), self.CHUNK_SIZE):
+            payload = ",".join(str(guild_id) for guild_id in guild_ids[start:start + self.CHUNK_SIZE])
+            await conn.execute("SELECT pg_notify($1, $2);", self.CHANNEL, payload)
+
+    async def _upsert(self, conn, rows):
+        # Rows that didn't change aren't rewritten
+        query = """INSERT INTO emoji_directory (id, name, animated, guild_id, available)
+                   VALUES ($1, $2, $3, $4, $5)
+                   ON CONFLICT (id) DO UPDATE
+                   SET name=EXCLUDED.name, animated=EXCLUDED.animated, guild_id=EXCLUDED.guild_id, available=EXCLUDED.available
+                   WHERE (emoji_directory.name, emoji_directory.animated, emoji_directory.guild_id, emoji_directory.available)
+                   IS DISTINCT FROM (EXCLUDED.name, EXCLUDED.animated, EXCLUDED.guild_id, EXCLUDED.available);
+                """
+        await conn.executemany(query, rows)
+
+    async def sync(self, guilds):
+        """Writes every emoji of this process's guilds, and removes the emojis of guilds on its shards that it left.
+
+        Unavailable guilds have no emojis cached, so they're left as they are
+        until they're synced again when they become available.
+        """
+
+        joined = [guild.id for guild in guilds]
+        available = [guild for guild in guilds if not guild.unavailable]
+        guild_ids = [guild.id for guild in available]
+        rows = self._rows(emoji for guild in available for emoji in guild.emojis)
+
+        async with self.bot.db.acquire() as conn:
+            async with conn.transaction():
+                await self._upsert(conn, rows)
+
+                query = """DELETE FROM emoji_directory
+                           WHERE emoji_directory.guild_id=ANY($1) AND NOT emoji_directory.id=ANY($2);
+                        """
+                await conn.execute(query, guild_ids, [row[0] for row in rows])
+
+                # A guild is on shard (guild_id >> 22) % shard_count
+                query = """DELETE FROM emoji_directory
+                           WHERE ((emoji_directory.guild_id >> 22) % $1)=ANY($2) AND NOT emoji_directory.guild_id=ANY($3)
+                           RETURNING emoji_directory.guild_id;
+                        """
+                left = await conn.fetch(query, self.bot.shard_count, list(self.bot.shards), joined)
+
+                await self._notify(conn, guild_ids + list({record["guild_id"] for record in left}))
+
+        self.synced += len(rows)
+
+    async def sync_guild(self, guild):
+        """Writes every emoji of a guild and removes the ones it no longer has."""
+
+        rows = self._rows(guild.emojis)
+
+        async with self.bot.db.acquire() as conn:
+            async with conn.transaction():
+                await self._upsert(conn, rows)
+
+                query = """DELETE FROM emoji_directory
+                           WHERE emoji_directory.guild_id=$1 AND NOT emoji_directory.id=ANY($2);
+                        """
+                await conn.execute(query, guild.id, [row[0] for row in rows])
+                await self._notify(conn, [guild.id])
+
+        self.synced += len(rows)
+
+    async def update(self, guild, before, after):
+        """Writes only the emojis that changed in an emoji update event."""
+
+        old = {emoji.id: (emoji.name, emoji.animated, emoji.available) for emoji in before}
+        changed = [emoji for emoji in after if old.get(emoji.id) != (emoji.name, emoji.animated, emoji.available)]
+        deleted = list(old.keys() - {emoji.id for emoji in after})
+
+        if not changed and not deleted:
+            return
+
+        async with self.bot.db.acquire() as conn:
+            async with conn.transaction():
+                if changed:
+                    await self._upsert(conn, self._rows(changed))
+
+                if deleted:
+                    query = """DELETE FROM emoji_directory
+                               WHERE emoji_directory.id=ANY($1);
+                            """
+                    await conn.execute(query, deleted)
+
+                await self._notify(conn, [guild.id])
+
+        self.synced += len(changed) + len(deleted)
+
+    async def remove_guild(self, guild):
+        """Removes every emoji of a guild the bot left."""
+
+        async with self.bot.db.acquire() as conn:
+            async with conn.transaction():
+                query = """DELETE FROM emoji_directory
+                           WHERE emoji_directory.guild_id=$1;
+                        """
+                await conn.execute(query, guild.id)
+                await self._notify(conn, [guild.id])
+
+    async def close(self):
+        if self._reloader:
+            self._reloader.cancel()
+
+        await self._listener.close()
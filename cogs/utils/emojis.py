@@ -0,0 +1,182 @@
+import heapq
+import re
+
+# Existing emoji markup is matched first so names inside it are left alone
+EMOJI_TOKEN = re.compile(r"(?P<full><a?:\w+:\d+>)|;(?P<semi>\w+);|:(?P<colon>\w+):")
+
+def replace(content, get):
+    """Replaces ;name; and :name: with the emojis returned by get in a single pass.
+
+    Returns the replaced content and the unique emojis used, in order.
+    """
+
+    parts = []
+    found = []
+    seen = set()
+
+    search = EMOJI_TOKEN.search
+    last = 0
+    position = 0
+
+    while True:
+        match = search(content, position)
+        if not match:
+            break
+
+        name = match.group("semi") or match.group("colon")
+        if not name:
+            position = match.end()
+            continue
+
+        emoji = get(name)
+        if not emoji:
+            # The closing delimiter can open the next token
+            position = match.end() - 1
+            continue
+
+        emoji = str(emoji)
+        parts.append(content[last:match.start()])
+        parts.append(emoji)
+        last = position = match.end()
+
+        if emoji not in seen:
+            seen.add(emoji)
+            found.append(emoji)
+
+    if not parts:
+        return content, found
+
+    parts.append(content[last:])
+    return "".join(parts), found
+
+class EmojiIndex:
+    """Represents a name to emoji lookup table for every emoji the bot can see."""
+
+    def __init__(self):
+        self._names = {}
+        self._guilds = {}
+        self._emojis = {}
+
+        # Maps each lowercase character to the IDs of the emojis that have it in their name
+        self._grams = {}
+
+    def build(self, guilds):
+        """Rebuilds the index from scratch from guilds with an emojis list."""
+
+        self.clear()
+
+        for guild in guilds:
+            self.update_guild(guild.id, guild.emojis)
+
+    def clear(self):
+        self._names.clear()
+        self._guilds.clear()
+        self._emojis.clear()
+        self._grams.clear()
+
+    def remove_guild(self, guild_id):
+        """Removes all the emojis from a guild."""
+
+        emojis = self._guilds.pop(guild_id, {})
+
+        for emoji in emojis.values():
+            self._remove(emoji)
+
+    def update_guild(self, guild_id, emojis):
+        """Replaces the emojis of a guild with a new list."""
+
+        indexed = self._guilds.setdefault(guild_id, {})
+        ids = {emoji.id for emoji in emojis}
+
+        # Drop deleted emojis
+        for emoji_id in list(indexed):
+            if emoji_id not in ids:
+                self._remove(indexed.pop(emoji_id))
+
+        for emoji in emojis:
+            # Drop the old name of renamed emojis
+            old = indexed.get(emoji.id)
+            if old:
+                self._remove(old)
+
+            indexed[emoji.id] = emoji
+            self._add(emoji)
+
+        if not indexed:
+            del self._guilds[guild_id]
+
+    def _add(self, emoji):
+        self._emojis[emoji.id] = emoji
+        self._names.setdefault(emoji.name, {})[emoji.id] = emoji
+
+        for gram in set(emoji.name.lower()):
+            self._grams.setdefault(gram, set()).add(emoji.id)
+
+    def _remove(self, emoji):
+        self._emojis.pop(emoji.id, None)
+
+        emojis = self._names.get(emoji.name)
+        if emojis is not None:
+            emojis.pop(emoji.id, None)
+            if not emojis:
+                del self._names[emoji.name]
+
+        for gram in set(emoji.name.lower()):
+            ids = self._grams.get(gram)
+            if ids is not None:
+                ids.discard(emoji.id)
+                if not ids:
+                    del self._grams[gram]
+
+    def get(self, name):
+        """Gets the first emoji with a name."""
+
+        emojis = self._names.get(name)
+        if not emojis:
+            return None
+
+        return next(iter(emojis.values()))
+
+    def search(self, text, *, limit=None, with_total=False):
+        """Fuzzy searches the emoji names, ranked the same way as finder.
+
+        If with_total is True, returns the results and how many emojis matched before the limit.
+        """
+
+        text = str(text)
+        regex = re.compile(".*?".join(map(re.escape, text)), flags=re.IGNORECASE)
+
+        # A name can only match if it contains every character of the search,
+        # so intersect the smallest candidate sets first
+        grams = sorted((self._grams.get(gram, set()) for gram in set(text.lower())), key=len)
+        if grams:
+            candidates = set(grams[0])
+            for ids in grams[1:]:
+                candidates &= ids
+                if not candidates:
+                    break
+        else:
+            candidates = self._emojis
+
+        suggestions = []
+        for emoji_id in candidates:
+            emoji = self._emojis[emoji_id]
+            r = regex.search(emoji.name)
+            if r:
+                suggestions.append((len(r.group()), r.start(), emoji.name, emoji_id, emoji))
+
+        total = len(suggestions)
+
+        if limit is None:
+            suggestions.sort()
+        else:
+            suggestions = heapq.nsmallest(limit, suggestions)
+
+        results = [emoji for *_, emoji in suggestions]
+        return (results, total) if with_total else results
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def __len__(self):
+        return len(self._emojis)
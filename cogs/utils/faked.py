@@ -1,13 +1,288 @@
 import discord
 
+import asyncio
+import collections
+import datetime
+import logging
+import sys
+import time
+
+from . import formats
+
+log = logging.getLogger("emote_wizard.faked")
+
 class FakedMessage:
-    """Represents a user sent message that has been replace by a webhook."""
+    """Represents a user sent message that has been replace by a webhook.
+
+    Only the IDs needed to edit or delete the replacement are kept, instead of the messages themselves.
+    """
+
+    __slots__ = ("replacement_id", "original_id", "channel_id", "guild_id", "author_id", "webhook_id", "webhook_token", "kind", "reply_header", "created_at")
+
+    def __init__(self, *, replacement_id, original_id, channel_id, guild_id, author_id, webhook_id, webhook_token, kind="message", reply_header=None, created_at=None):
+        self.replacement_id = replacement_id
+        self.original_id = original_id
+        self.channel_id = channel_id
+        self.guild_id = guild_id
+        self.author_id = author_id
+        self.webhook_id = webhook_id
+        self.webhook_token = webhook_token
+        self.kind = kind
+        self.reply_header = reply_header
+        self.created_at = created_at or time.time()
+
+    @classmethod
+    def from_repost(cls, original, replacement, webhook, *, reply=None, is_sticker=False):
+        return cls(
+            replacement_id=replacement.id,
+            original_id=original.id,
+            channel_id=original.channel.id,
+            guild_id=original.guild.id,
+            author_id=original.author.id,
+            webhook_id=webhook.id,
+            webhook_token=webhook.token,
+            kind="reply" if reply else "sticker" if is_sticker else "message",
+            reply_header=reply.header if reply else None
+        )
+
+    @property
+    def is_sticker(self):
+        return self.kind == "sticker"
+
+    @property
+    def is_reply(self):
+        return self.kind == "reply"
+
+    def webhook(self, bot):
+        """Builds a partial webhook that can edit and delete the replacement."""
+
+        return discord.Webhook.partial(self.webhook_id, self.webhook_token, client=bot)
+
+    def format_with(self, bot, content):
+        """Formats new content the same way the replacement was formatted."""
+
+        if self.is_reply:
+            return self.reply_header + bot.replace_emojis(discord.utils.escape_mentions(content))[0]
+
+        return bot.replace_emojis(content)[0]
+
+    async def edit(self, bot, content):
+        await self.webhook(bot).edit_message(
+            self.replacement_id,
+            content=self.format_with(bot, content),
+            allowed_mentions=discord.AllowedMentions(users=True) if self.is_reply else discord.utils.MISSING
+        )
+
+    async def delete(self, bot):
+        await self.webhook(bot).delete_message(self.replacement_id)
+
+    def __sizeof__(self):
+        size = super().__sizeof__() + sys.getsizeof(self.webhook_token)
+        if self.reply_header:
+            size += sys.getsizeof(self.reply_header)
+        return size
+
+class FakedMessageStore:
+    """Represents the faked messages that can still be edited or deleted, keyed by replacement ID.
+
+    Recent messages are kept in memory, and the oldest are evicted from
+    memory once there are more than max_size or once they are older than
+    max_age seconds. Every message is also written to the database in
+    batches in the background, so lookups that miss memory, for example
+    after a restart, fall back to the database for up to retention seconds.
+    """
+
+    def __init__(self, db, *, max_size=20000, max_age=24 * 60 * 60, retention=30 * 24 * 60 * 60, flush_interval=1.0, batch_size=500):
+        self.db = db
+        self.max_size = max_size
+        self.max_age = max_age
+        self.retention = retention
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        self._messages = collections.OrderedDict()
+
+        # Replacement IDs to write, mapped to the message to insert or None to delete
+        self._pending = {}
+        self._wakeup = asyncio.Event()
+        self._flusher = asyncio.create_task(self._flush_loop())
+        self._pruned_at = 0
+
+        self.evicted_size = 0
+        self.evicted_age = 0
+        self.hits = 0
+        self.database_hits = 0
+        self.misses = 0
+        self.flushed = 0
+
+    def _evict(self):
+        while len(self._messages) > self.max_size:
+            self._messages.popitem(last=False)
+            self.evicted_size += 1
+
+        # Messages are stored in the order they were made, so the oldest are first
+        expired = time.time() - self.max_age
+        while self._messages:
+            faked = next(iter(self._messages.values()))
+            if faked.created_at >= expired:
+                break
+
+            self._messages.popitem(last=False)
+            self.evicted_age += 1
+
+    def add(self, faked):
+        self._messages[faked.replacement_id] = faked
+        self._evict()
+        self._queue(faked.replacement_id, faked)
+
+    def get(self, replacement_id):
+        """Gets a faked message from memory only."""
+
+        faked = self._messages.get(replacement_id)
+
+        if faked and faked.created_at < time.time() - self.max_age:
+            self._evict()
+            return None
+
+        return faked
+
+    async def fetch(self, replacement_id):
+        """Gets a faked message, falling back to the database if it isn't in memory."""
+
+        faked = self.get(replacement_id)
+        if faked:
+            self.hits += 1
+            return faked
 
-    def __init__(self, *, original, replacement, reply=None, is_sticker=False):
-        self.original = original
-        self.replacement = replacement
-        self.reply = reply
-        self.is_sticker = is_sticker
+        if replacement_id in self._pending:
+            self.hits += 1
+            return self._pending[replacement_id]
+
+        query = """SELECT *
+                   FROM faked_messages
+                   WHERE faked_messages.replacement_id=$1;
+                """
+        record = await self.db.fetchrow(query, replacement_id)
+
+        if not record:
+            self.misses += 1
+            return None
+
+        faked = FakedMessage(
+            replacement_id=record["replacement_id"],
+            original_id=record["original_id"],
+            channel_id=record["channel_id"],
+            guild_id=record["guild_id"],
+            author_id=record["author_id"],
+            webhook_id=record["webhook_id"],
+            webhook_token=record["webhook_token"],
+            kind=record["kind"],
+            reply_header=record["reply_header"],
+            created_at=record["created_at"].replace(tzinfo=datetime.timezone.utc).timestamp()
+        )
+
+        if faked.created_at < time.time() - self.retention:
+            self.misses += 1
+            return None
+
+        self.database_hits += 1
+
+        # Keep it in memory for the next edit, unless memory would evict it straight away
+        if faked.created_at >= time.time() - self.max_age:
+            self._messages[faked.replacement_id] = faked
+
+        return faked
+
+    def remove(self, replacement_id):
+        """Removes a faked message from memory and the database."""
+
+        self._messages.pop(replacement_id, None)
+        self._queue(replacement_id, None)
+
+    def _queue(self, replacement_id, faked):
+        self._pending[replacement_id] = faked
+
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+
+            self._wakeup.clear()
+
+            try:
+                await self.flush()
+            except Exception as exc:
+                log.warning(f"Couldn't write faked messages: {exc}")
+
+    async def flush(self):
+        """Writes the queued changes to the database."""
+
+        if not self._pending:
+            return
+
+        pending, self._pending = self._pending, {}
+
+        inserts = [
+            (
+                faked.replacement_id, faked.original_id, faked.channel_id, faked.guild_id, faked.author_id,
+                faked.webhook_id, faked.webhook_token, faked.kind, faked.reply_header,
+                datetime.datetime.utcfromtimestamp(faked.created_at)
+            )
+        for faked in pending.values() if faked]
+        deletes = [(replacement_id,) for replacement_id, faked in pending.items() if not faked]
+
+        try:
+            async with self.db.acquire() as conn:
+                async with conn.transaction():
+                    if inserts:
+                        query = """INSERT INTO faked_messages (replacement_id, original_id, channel_id, guild_id, author_id, webhook_id, webhook_token, kind, reply_header, created_at)
+                                   VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10)
+                                   ON CONFLICT (replacement_id) DO NOTHING;
+                                """
+                        await conn.executemany(query, inserts)
+
+                    if deletes:
+                        query = """DELETE FROM faked_messages
+                                   WHERE faked_messages.replacement_id=$1;
+                                """
+                        await conn.executemany(query, deletes)
+        except BaseException:
+            # Put the changes back, without overwriting anything newer, so the next flush retries them
+            self._pending = {**pending, **self._pending}
+            raise
+
+        self.flushed += len(pending)
+
+        # Prune expired rows about once an hour
+        if time.time() - self._pruned_at > 60 * 60:
+            self._pruned_at = time.time()
+
+            query = """DELETE FROM faked_messages
+                       WHERE faked_messages.created_at < $1;
+                    """
+            await self.db.execute(query, datetime.datetime.utcfromtimestamp(time.time() - self.retention))
+
+    async def close(self):
+        """Stops the background writer and writes anything still queued."""
+
+        self._flusher.cancel()
+
+        # A flush that was running puts its batch back once it's cancelled, so wait for that before the last flush
+        await asyncio.gather(self._flusher, return_exceptions=True)
+        await self.flush()
+
+    def memory(self):
+        """Estimates the bytes used by the messages in memory."""
+
+        return sum(sys.getsizeof(faked) for faked in self._messages.values())
+
+    def __len__(self):
+        return len(self._messages)
 
 class Reply:
     """Represents a reply to another message."""
@@ -18,11 +293,11 @@ class Reply:
         self.emoji = emoji
         self.mention = mention
 
-    def format_with(self, content):
-        formatted_content = self.bot.replace_emojis(discord.utils.escape_mentions(content))[0]
+    @property
+    def header(self):
+        """The quoted message that goes above the reply's content."""
 
         author = f"> {self.emoji} {self.quote.author.mention}{f'<:bottag:779737977856720906>' if self.quote.author.bot else ''}"
-        reply = f"> [Jump to message](<{self.quote.jump_url}>) \n{formatted_content}"
 
         if self.quote.content:
             content = "\n".join([f"> {discord.utils.escape_mentions(line)}" for line in self.quote.content.split("\n")])
@@ -37,7 +312,11 @@ class Reply:
 
             content = f"> Jump to view {formats.join(items, last='and')} <:imageicon:779737947121123349>"
 
-        return f"{author} \n{content} \n{reply}"
+        return f"{author} \n{content} \n> [Jump to message](<{self.quote.jump_url}>) \n"
+
+    def format_with(self, content):
+        formatted_content = self.bot.replace_emojis(discord.utils.escape_mentions(content))[0]
+        return f"{self.header}{formatted_content}"
 
     @property
     def allowed_mentions(self):
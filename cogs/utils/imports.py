@@ -0,0 +1,94 @@
+import asyncio
+import importlib
+import re
+import sys
+
+# A line of python -X importtime output: self and cumulative microseconds, then the module indented by depth
+IMPORT_TIME = re.compile(r"import time:\s+(?P<self>\d+) \|\s+(?P<cumulative>\d+) \| (?P<indent> *)(?P<module>\S+)")
+
+class LazyModule:
+    """Represents a module that is only imported the first time one of its attributes is used."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+
+        return getattr(self._module, attr)
+
+    @property
+    def is_loaded(self):
+        return self._module is not None
+
+    def __repr__(self):
+        return f"<LazyModule {self._name!r} loaded={self.is_loaded}>"
+
+def lazy(name):
+    """Gets a module that is imported on first use, or the module itself if it's already imported."""
+
+    return sys.modules.get(name) or LazyModule(name)
+
+class ImportTime:
+    """Represents how long importing a module took."""
+
+    __slots__ = ("module", "depth", "self_time", "cumulative")
+
+    def __init__(self, module, depth, self_time, cumulative):
+        self.module = module
+        self.depth = depth
+        self.self_time = self_time
+        self.cumulative = cumulative
+
+def parse(output):
+    """Parses the output of python -X importtime, in seconds."""
+
+    times = []
+    for line in output.splitlines():
+        match = IMPORT_TIME.match(line)
+        if match:
+            times.append(ImportTime(
+                match.group("module"),
+                len(match.group("indent")) // 2,
+                int(match.group("self")) / 1e6,
+                int(match.group("cumulative")) / 1e6
+            ))
+
+    return times
+
+async def profile(module):
+    """Imports a module in a fresh interpreter and returns the import times of it and every module it pulled in."""
+
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-X", "importtime", "-c", f"import {module}",
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE
+    )
+    _, stderr = await process.communicate()
+
+    if process.returncode:
+        raise RuntimeError(f"Couldn't import {module}: {stderr.decode().strip().splitlines()[-1]}")
+
+    return parse(stderr.decode())
+
+def dependencies(times, module):
+    """Gets the import times of the modules a module imported directly."""
+
+    for index in range(len(times) - 1, -1, -1):
+        if times[index].module == module:
+            break
+    else:
+        return []
+
+    # Modules are printed after everything they imported, so its dependencies come right before it
+    parent = times[index]
+    found = []
+    for time in reversed(times[:index]):
+        if time.depth <= parent.depth:
+            break
+        if time.depth == parent.depth + 1:
+            found.append(time)
+
+    return found
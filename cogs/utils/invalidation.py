@@ -0,0 +1,48 @@
+import collections
+import logging
+
+log = logging.getLogger("emote_wizard.invalidation")
+
+# A guild's state should be dropped entirely, for example after the bot leaves it
+GUILD = "guild"
+# The guild's config row was written
+GUILD_CONFIG = "guild_config"
+# The webhooks in one of the guild's channels changed
+WEBHOOKS = "webhooks"
+# The guild's prefixes were written
+PREFIXES = "prefixes"
+
+class InvalidationBus:
+    """Routes invalidations of cached guild state to the caches that hold it.
+
+    Discord events and our own writes publish to a topic with the ID of the
+    guild that changed, so caches that register for the topic can keep
+    their entries for a long time instead of expiring them to stay correct.
+    """
+
+    def __init__(self):
+        self._callbacks = collections.defaultdict(list)
+        self.published = collections.Counter()
+
+    def register(self, topic, callback):
+        """Registers a callback that is called with the guild ID and any extra arguments of a topic."""
+
+        self._callbacks[topic].append(callback)
+
+    def unregister(self, topic, callback):
+        try:
+            self._callbacks[topic].remove(callback)
+        except ValueError:
+            pass
+
+    def publish(self, topic, guild_id, *args):
+        """Calls every callback registered for a topic."""
+
+        self.published[topic] += 1
+
+        for callback in list(self._callbacks[topic]):
+            try:
+                callback(guild_id, *args)
+            except Exception as exc:
+                # One broken cache shouldn't stop the rest from being invalidated
+                log.warning(f"Couldn't invalidate {topic} for guild {guild_id}: {exc}")
@@ -1,4 +1,6 @@
+import discord
 from discord.ext import menus
+from discord.ext.menus import MenuPages
 
 class Confirm(menus.Menu):
     def __init__(self, msg):
@@ -22,3 +24,20 @@ class Confirm(menus.Menu):
     async def prompt(self, ctx):
         await self.start(ctx, wait=True)
         return self.result
+
+class EmojiPages(menus.ListPageSource):
+    def __init__(self, data, *, total=None):
+        self.data = data
+        # How many emojis matched, which can be more than were kept
+        self.total = total if total is not None else len(data)
+        super().__init__(data, per_page=10)
+
+    async def format_page(self, menu, entries):
+        offset = menu.current_page * self.per_page
+        em = discord.Embed(description="", color=discord.Color.blurple())
+        for i, v in enumerate(entries, start=offset):
+            em.description += f"\n{v[1]} {v[0]}"
+        shown = f"{len(self.data)} emojis" if self.total == len(self.data) else f"Top {len(self.data)} of {self.total} emojis"
+        em.set_footer(text=f"{shown} | Page {menu.current_page+1}/{self.get_max_pages()}")
+
+        return em
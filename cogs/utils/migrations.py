@@ -0,0 +1,132 @@
+import asyncpg
+
+import logging
+
+log = logging.getLogger("emote_wizard.migrations")
+
+# Every change to the schema, in order. Applied versions are never run again,
+# so change the schema by adding a new version instead of editing an old one.
+# The early versions use IF NOT EXISTS since they were run on every boot before versions were recorded.
+MIGRATIONS = [
+    (1, "Create the original tables", """
+        CREATE TABLE IF NOT EXISTS guild_config (
+        guild_id BIGINT PRIMARY KEY,
+        webhook_id BIGINT
+        );
+
+        CREATE TABLE IF NOT EXISTS stickers (
+        owner_id BIGINT,
+        name TEXT UNIQUE,
+        content_path TEXT
+        );
+
+        CREATE TABLE IF NOT EXISTS avatar_emojis (
+        user_id BIGINT PRIMARY KEY,
+        emoji_id BIGINT,
+        avatar_url TEXT,
+        last_used TIMESTAMP DEFAULT (now() at time zone 'utc')
+        );
+    """),
+    (2, "Pool webhooks per channel", """
+        CREATE TABLE IF NOT EXISTS webhook_pool (
+        webhook_id BIGINT PRIMARY KEY,
+        webhook_token TEXT,
+        guild_id BIGINT,
+        channel_id BIGINT,
+        last_used TIMESTAMP DEFAULT (now() at time zone 'utc')
+        );
+
+        CREATE INDEX IF NOT EXISTS webhook_pool_guild_id_idx ON webhook_pool (guild_id);
+    """),
+    (3, "Persist faked messages", """
+        CREATE TABLE IF NOT EXISTS faked_messages (
+        replacement_id BIGINT PRIMARY KEY,
+        original_id BIGINT,
+        channel_id BIGINT,
+        guild_id BIGINT,
+        author_id BIGINT,
+        webhook_id BIGINT,
+        webhook_token TEXT,
+        kind TEXT,
+        reply_header TEXT,
+        created_at TIMESTAMP DEFAULT (now() at time zone 'utc')
+        );
+
+        CREATE INDEX IF NOT EXISTS faked_messages_created_at_idx ON faked_messages (created_at);
+    """),
+    (4, "Store prefixes in the database", """
+        CREATE TABLE IF NOT EXISTS prefixes (
+        guild_id BIGINT PRIMARY KEY,
+        prefixes TEXT ARRAY
+        );
+    """),
+    (5, "Add the emoji directory", """
+        CREATE TABLE IF NOT EXISTS emoji_directory (
+        id BIGINT PRIMARY KEY,
+        name TEXT,
+        animated BOOLEAN,
+        guild_id BIGINT,
+        available BOOLEAN
+        );
+
+        CREATE INDEX IF NOT EXISTS emoji_directory_guild_id_idx ON emoji_directory (guild_id);
+    """),
+    (6, "Report shard health", """
+        CREATE TABLE IF NOT EXISTS shard_health (
+        shard_id INTEGER PRIMARY KEY,
+        cluster_id INTEGER,
+        latency DOUBLE PRECISION,
+        closed BOOLEAN,
+        guilds INTEGER,
+        updated_at TIMESTAMP
+        );
+    """),
+]
+
+# Held while migrating, so processes of a cluster that start together don't migrate at once
+LOCK_ID = 0x456d6f7465
+
+async def applied_versions(conn):
+    try:
+        records = await conn.fetch("SELECT version FROM schema_migrations;")
+    except asyncpg.UndefinedTableError:
+        return set()
+
+    return {record["version"] for record in records}
+
+async def migrate(db):
+    """Applies the migrations that haven't been applied yet and returns how many were applied.
+
+    A database that is up to date costs a single query.
+    """
+
+    async with db.acquire() as conn:
+        latest = MIGRATIONS[-1][0]
+        if latest in await applied_versions(conn):
+            return 0
+
+        async with conn.transaction():
+            await conn.execute("SELECT pg_advisory_xact_lock($1);", LOCK_ID)
+
+            query = """CREATE TABLE IF NOT EXISTS schema_migrations (
+                       version INTEGER PRIMARY KEY,
+                       description TEXT,
+                       applied_at TIMESTAMP DEFAULT (now() at time zone 'utc')
+                       );
+                    """
+            await conn.execute(query)
+
+            # Another process might have migrated while we waited for the lock
+            applied = await applied_versions(conn)
+            pending = [migration for migration in MIGRATIONS if migration[0] not in applied]
+
+            for version, description, query in pending:
+                log.info(f"Applying migration {version}: {description}")
+                await conn.execute(query)
+
+                query = """INSERT INTO schema_migrations (version, description)
+                           VALUES ($1, $2);
+                        """
+                await conn.execute(query, version, description)
+
+        return len(pending)
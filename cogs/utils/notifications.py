@@ -0,0 +1,66 @@
+import asyncpg
+
+import asyncio
+import logging
+
+log = logging.getLogger("emote_wizard.notifications")
+
+class Listener:
+    """Represents a LISTEN on a Postgres channel, on a dedicated connection so it doesn't take one from the pool.
+
+    Notifications sent while the connection was down are lost, so
+    on_reconnect is awaited after reconnecting to reload anything that
+    could have been missed.
+    """
+
+    def __init__(self, dsn, channel, callback, *, on_reconnect=None):
+        self.dsn = dsn
+        self.channel = channel
+        self.callback = callback
+        self.on_reconnect = on_reconnect
+
+        self._conn = None
+        self._reconnecting = None
+        self._closed = False
+
+    async def start(self):
+        self._conn = await asyncpg.connect(self.dsn)
+        self._conn.add_termination_listener(self._terminated)
+        await self._conn.add_listener(self.channel, self._notified)
+
+    def _notified(self, conn, pid, channel, payload):
+        try:
+            self.callback(payload)
+        except Exception as exc:
+            log.warning(f"Couldn't handle {channel} notification {payload!r}: {exc}")
+
+    def _terminated(self, conn):
+        if self._closed or (self._reconnecting and not self._reconnecting.done()):
+            return
+
+        log.warning(f"Lost the {self.channel} listener connection, reconnecting")
+        self._reconnecting = asyncio.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        delay = 1
+
+        while not self._closed:
+            try:
+                await self.start()
+                if self.on_reconnect:
+                    await self.on_reconnect()
+                return
+            except (OSError, asyncpg.PostgresError) as exc:
+                log.warning(f"Couldn't reconnect the {self.channel} listener: {exc}")
+
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60)
+
+    async def close(self):
+        self._closed = True
+
+        if self._reconnecting:
+            self._reconnecting.cancel()
+
+        if self._conn and not self._conn.is_closed():
+            await self._conn.close()
@@ -0,0 +1,186 @@
+import json
+import logging
+import os
+
+from . import invalidation, notifications
+
+log = logging.getLogger("emote_wizard.prefixes")
+
+# The prefixes of guilds that haven't set any, and of DMs
+DEFAULT_PREFIXES = ("e!", "e.")
+PRIVATE_PREFIXES = ("e!", "e.", "!")
+
+# Held while importing the old JSON file, so only one process of a cluster imports it
+IMPORT_LOCK_ID = 0x707265666978
+
+class PrefixStore:
+    """Represents the custom prefixes of every guild, stored in the database.
+
+    Every process keeps a full copy in memory. Writes update the database
+    and notify every process listening, including the one that wrote, so
+    each copy stays current without querying the database per message.
+    """
+
+    CHANNEL = "prefixes"
+
+    def __init__(self, bot):
+        self.bot = bot
+
+        # Guild IDs mapped to a tuple of their prefixes, which can be empty
+        self._prefixes = {}
+
+        self._listener = notifications.Listener(bot.config.sql, self.CHANNEL, self._notified, on_reconnect=self.load)
+
+    async def start(self):
+        """Starts listening for changes and loads every guild's prefixes."""
+
+        # Listen before loading so no change made in between is missed
+        await self._listener.start()
+        await self.load()
+
+    async def load(self):
+        """Loads every guild's prefixes from the database."""
+
+        records = await self.bot.db.fetch("SELECT * FROM prefixes;")
+        prefixes = {record["guild_id"]: tuple(record["prefixes"]) for record in records}
+
+        # Invalidate the guilds that changed, for example while the listener was reconnecting
+        changed = {guild_id for guild_id in self._prefixes.keys() | prefixes.keys() if self._prefixes.get(guild_id) != prefixes.get(guild_id)}
+        self._prefixes = prefixes
+
+        for guild_id in changed:
+            self.bot.invalidation.publish(invalidation.PREFIXES, guild_id)
+
+    def _apply(self, guild_id, prefixes):
+        prefixes = tuple(prefixes)
+        if self._prefixes.get(guild_id) == prefixes:
+            return
+
+        self._prefixes[guild_id] = prefixes
+
+        self.bot.invalidation.publish(invalidation.PREFIXES, guild_id)
+
+    def _notified(self, payload):
+        data = json.loads(payload)
+        self._apply(data["guild_id"], data["prefixes"])
+
+    async def set(self, guild_id, prefixes):
+        """Sets a guild's prefixes. An empty list leaves only the mention prefixes."""
+
+        prefixes = list(prefixes)
+        payload = json.dumps({"guild_id": guild_id, "prefixes": prefixes})
+
+        # The notification is only sent if the transaction commits
+        async with self.bot.db.acquire() as conn:
+            async with conn.transaction():
+                query = """INSERT INTO prefixes (guild_id, prefixes)
+                           VALUES ($1, $2)
+                           ON CONFLICT (guild_id) DO UPDATE
+                           SET prefixes=$2;
+                        """
+                await conn.execute(query, guild_id, prefixes)
+
+                await conn.execute("SELECT pg_notify($1, $2);", self.CHANNEL, payload)
+
+        # The change is applied when our own notification arrives, since notifications
+        # arrive in commit order and applying it here could overwrite a newer write
+
+    async def import_json(self, filename="prefixes.json"):
+        """Imports the prefixes of the old JSON file once, then renames it so it isn't imported again.
+
+        Guilds that already have prefixes in the database are skipped.
+        """
+
+        if not os.path.exists(filename):
+            return 0
+
+        # Processes of a cluster that start together take turns, and the ones after the first find the file gone.
+        # The lock is held past the commit so the file is only renamed once the rows are written.
+        async with self.bot.db.acquire() as conn:
+            await conn.execute("SELECT pg_advisory_lock($1);", IMPORT_LOCK_ID)
+
+            try:
+                try:
+                    with open(filename, "r") as file:
+                        data = json.load(file)
+                except FileNotFoundError:
+                    return 0
+
+                query = """INSERT INTO prefixes (guild_id, prefixes)
+                           VALUES ($1, $2)
+                           ON CONFLICT (guild_id) DO NOTHING;
+                        """
+                await conn.executemany(query, [(int(guild_id), list(prefixes)) for guild_id, prefixes in data.items()])
+
+                try:
+                    os.replace(filename, f"{filename}.imported")
+                except FileNotFoundError:
+                    return 0
+            finally:
+                await conn.execute("SELECT pg_advisory_unlock($1);", IMPORT_LOCK_ID)
+
+        log.info(f"Imported the prefixes of {len(data)} guilds from {filename}")
+
+        return len(data)
+
+    def get(self, guild_id, default=None):
+        return self._prefixes.get(guild_id, default)
+
+    async def close(self):
+        await self._listener.close()
+
+    def __contains__(self, guild_id):
+        return guild_id in self._prefixes
+
+    def __len__(self):
+        return len(self._prefixes)
+
+class PrefixMatcher:
+    """Represents the prefixes each guild listens for, as tuples ready for str.startswith.
+
+    A guild's tuple is built the first time it's needed and reused until its
+    prefixes change. Every guild using the default prefixes shares one tuple.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+
+        # Only guilds with their own prefixes are kept here
+        self._guilds = {}
+        self._default = None
+        self._private = None
+
+        self.built = 0
+
+    def _build(self, prefixes):
+        self.built += 1
+
+        user_id = self.bot.user.id
+        return (f"<@!{user_id}> ", f"<@{user_id}> ", *prefixes)
+
+    def get(self, guild):
+        """Gets the prefixes for a guild, or for DMs if guild is None."""
+
+        if guild is None:
+            if self._private is None:
+                self._private = self._build(PRIVATE_PREFIXES)
+            return self._private
+
+        matcher = self._guilds.get(guild.id)
+        if matcher is not None:
+            return matcher
+
+        prefixes = self.bot.prefixes.get(guild.id)
+        if prefixes is None:
+            if self._default is None:
+                self._default = self._build(DEFAULT_PREFIXES)
+            return self._default
+
+        matcher = self._guilds[guild.id] = self._build(prefixes)
+        return matcher
+
+    def invalidate(self, guild_id, *args):
+        self._guilds.pop(guild_id, None)
+
+    def __len__(self):
+        return len(self._guilds)
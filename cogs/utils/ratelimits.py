@@ -0,0 +1,173 @@
+import aiohttp
+
+import asyncio
+import collections
+import contextlib
+import re
+import time
+
+ROUTE = re.compile(r"/api/v\d+/(?P<major>webhooks|channels)/(?P<id>\d+)(?P<rest>/[^?]*)?")
+
+class Bucket:
+    __slots__ = ("limit", "remaining", "reset_after", "reset_at")
+
+    def __init__(self, limit, remaining, reset_after):
+        self.limit = limit
+        self.remaining = remaining
+        self.reset_after = reset_after
+        self.reset_at = time.monotonic() + reset_after
+
+class RateLimiter:
+    """Schedules webhook traffic ahead of Discord's rate limits instead of waiting for 429s.
+
+    Bucket state is read from the rate limit headers of every response the
+    bot gets. Sends wait for their bucket to reset instead of being rejected,
+    deletes wait while sends in the same guild are pending, and callers can
+    check the projected wait to degrade instead of queueing for too long.
+    """
+
+    SEND = 0
+    EDIT = 1
+    DELETE = 2
+
+    def __init__(self, *, max_wait=2.0, max_defer=10.0):
+        self.max_wait = max_wait
+        self.max_defer = max_defer
+
+        self.buckets = {}
+        self.pending = collections.defaultdict(collections.Counter)
+
+        self.delayed = 0
+        self.shed = 0
+
+    @staticmethod
+    def route(method, path):
+        """Gets the key of the bucket a request falls in."""
+
+        match = ROUTE.match(path)
+        if not match:
+            return None
+
+        rest = match.group("rest") or ""
+        if match.group("major") == "webhooks" and rest:
+            # The first segment after a webhook ID is its token
+            rest = re.sub(r"^/[^/]+", "/{token}", rest)
+
+        return (method, match.group("major"), int(match.group("id")), re.sub(r"/\d+", "/{id}", rest))
+
+    @classmethod
+    def webhook_send(cls, webhook):
+        return cls.route("POST", f"/api/v10/webhooks/{webhook.id}/token")
+
+    @classmethod
+    def message_delete(cls, channel):
+        return cls.route("DELETE", f"/api/v10/channels/{channel.id}/messages/0")
+
+    def trace_config(self):
+        """Creates a trace config that reads the rate limit headers of responses."""
+
+        async def on_request_end(session, context, params):
+            key = self.route(params.method, params.url.path)
+            if key:
+                self.update(key, params.response.headers)
+
+        trace = aiohttp.TraceConfig()
+        trace.on_request_end.append(on_request_end)
+        return trace
+
+    def update(self, key, headers):
+        """Updates a bucket from the headers of a response."""
+
+        try:
+            limit = int(headers["X-RateLimit-Limit"])
+            remaining = int(headers["X-RateLimit-Remaining"])
+            reset_after = float(headers["X-RateLimit-Reset-After"])
+        except (KeyError, ValueError):
+            return
+
+        self.buckets[key] = Bucket(limit, remaining, reset_after)
+
+        # Forget buckets that have reset once there are a lot of them
+        if len(self.buckets) > 10000:
+            now = time.monotonic()
+            self.buckets = {key: bucket for key, bucket in self.buckets.items() if bucket.reset_at > now}
+
+    def projected_wait(self, key):
+        """Estimates how long a new request to a bucket would have to wait, in seconds."""
+
+        bucket = self.buckets.get(key)
+        if not bucket:
+            return 0.0
+
+        now = time.monotonic()
+        if now >= bucket.reset_at:
+            return 0.0
+
+        ahead = sum(self.pending.get(key, {}).values())
+        if bucket.remaining > ahead:
+            return 0.0
+
+        # Every window after the current one lets another limit of requests through
+        windows = (ahead - bucket.remaining) // max(bucket.limit, 1)
+        return bucket.reset_at - now + windows * bucket.reset_after
+
+    def should_shed(self, key):
+        """Checks if a request should be degraded instead of waiting for its bucket."""
+
+        if self.projected_wait(key) > self.max_wait:
+            self.shed += 1
+            return True
+
+        return False
+
+    @contextlib.asynccontextmanager
+    async def slot(self, key, priority, *, group=None):
+        """Waits until a request can be made without hitting its bucket's limit.
+
+        Requests with a lower priority also wait, up to max_defer seconds,
+        while requests with a higher priority in the same group are pending.
+        """
+
+        self.pending[key][priority] += 1
+        if group is not None:
+            self.pending[group][priority] += 1
+
+        try:
+            deadline = time.monotonic() + self.max_defer
+
+            while group is not None and time.monotonic() < deadline:
+                if not any(count for other, count in self.pending[group].items() if other < priority):
+                    break
+                await asyncio.sleep(0.1)
+
+            delayed = False
+            while True:
+                bucket = self.buckets.get(key)
+                if not bucket:
+                    break
+
+                now = time.monotonic()
+                if now >= bucket.reset_at:
+                    # Assume a fresh window until a response says otherwise
+                    bucket.remaining = bucket.limit
+                    bucket.reset_at = now + bucket.reset_after
+
+                if bucket.remaining > 0:
+                    bucket.remaining -= 1
+                    break
+
+                if not delayed:
+                    delayed = True
+                    self.delayed += 1
+
+                await asyncio.sleep(bucket.reset_at - now)
+
+            yield
+        finally:
+            for name in (key, group):
+                if name is None:
+                    continue
+
+                self.pending[name][priority] -= 1
+                if not +self.pending[name]:
+                    del self.pending[name]
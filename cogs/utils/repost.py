@@ -0,0 +1,158 @@
+import discord
+
+import asyncio
+import collections
+import contextlib
+import logging
+import time
+
+from . import faked
+from .ratelimits import RateLimiter
+
+log = logging.getLogger("emote_wizard.repost")
+
+class RepostExecutor:
+    """Reposts messages through the guild's webhook, overlapping the Discord calls that don't depend on each other.
+
+    A repost takes its place in the guild's queue as soon as it's made, then
+    resolves the webhook and downloads the attachments while earlier reposts
+    send. The original is deleted in the background once the repost has been sent.
+    Messages whose attachments can't all be forwarded aren't reposted.
+    """
+
+    STAGES = ("prepare", "queue", "send", "delete", "total")
+
+    def __init__(self, bot, *, samples=1000):
+        self.bot = bot
+
+        # Recent latencies of each stage in seconds
+        self.timings = {stage: collections.deque(maxlen=samples) for stage in self.STAGES}
+        self._tasks = set()
+
+    async def repost(self, original, *, content=None, attachments=(), files=(), allowed_mentions=discord.utils.MISSING, reply=None, is_sticker=False):
+        """Reposts a message as its author and records it so it can be edited or deleted later.
+
+        Returns the replacement message, or None if the guild has no usable webhook,
+        the webhook is rate limited for too long or the attachments couldn't be forwarded.
+        """
+
+        start = time.perf_counter()
+        channel = original.channel
+        author = original.author
+
+        async with contextlib.AsyncExitStack() as stack:
+            async def prepare():
+                config = await self.bot.get_webhook_config(channel.guild)
+                if not config.webhook_id:
+                    return None
+
+                # Fetch the webhook while the attachments download
+                fetching = asyncio.ensure_future(config.webhook())
+
+                try:
+                    # The downloads are held against the budget until the stack exits, after the send
+                    downloaded = await stack.enter_async_context(
+                        self.bot.attachments.forward(attachments, limit=channel.guild.filesize_limit)
+                    )
+                    if downloaded is None:
+                        return None
+
+                    webhook = await fetching
+                finally:
+                    fetching.cancel()
+
+                if not webhook:
+                    return None
+
+                self.timings["prepare"].append(time.perf_counter() - start)
+                return config, downloaded
+
+            # Prepare while earlier reposts in the guild are sending
+            preparing = asyncio.ensure_future(prepare())
+
+            async def send():
+                self.timings["queue"].append(time.perf_counter() - start)
+
+                prepared = await preparing
+                if not prepared:
+                    return None
+
+                config, downloaded = prepared
+                sending = time.perf_counter()
+
+                try:
+                    webhook = await config.webhook_for(channel)
+                    if not webhook:
+                        return None
+
+                    # Let the caller fall back to the bot account instead of waiting on a long rate limit
+                    key = RateLimiter.webhook_send(webhook)
+                    if self.bot.rate_limiter.should_shed(key):
+                        return None
+
+                    async with self.bot.rate_limiter.slot(key, RateLimiter.SEND, group=("guild", channel.guild.id)):
+                        replacement = await webhook.send(
+                            content=content,
+                            files=[*files, *downloaded],
+                            username=author.display_name,
+                            avatar_url=author.display_avatar.url,
+                            allowed_mentions=allowed_mentions,
+                            wait=True
+                        )
+                except discord.NotFound:
+                    # The webhook was deleted, so forget it
+                    config.invalidate_webhook(channel)
+                    return None
+
+                self.timings["send"].append(time.perf_counter() - sending)
+
+                self.bot.faked_messages.add(faked.FakedMessage.from_repost(
+                    original,
+                    replacement,
+                    webhook,
+                    reply=reply,
+                    is_sticker=is_sticker
+                ))
+
+                return replacement
+
+            try:
+                # Take the message's place in the guild's queue before anything yields,
+                # so reposts send in the order their messages arrived however long they take to prepare
+                replacement = await self.bot.reposts.submit(channel.guild.id, send)
+            finally:
+                # Let the downloads finish or stop before the stack releases their budget
+                preparing.cancel()
+                await asyncio.gather(preparing, return_exceptions=True)
+
+        if replacement:
+            self.timings["total"].append(time.perf_counter() - start)
+
+            # Nothing waits on the delete, so don't hold up the caller for it
+            task = asyncio.create_task(self._delete(original))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        return replacement
+
+    async def _delete(self, message):
+        start = time.perf_counter()
+
+        try:
+            # Deletes wait for the guild's pending sends, since nobody sees them happen late
+            key = RateLimiter.message_delete(message.channel)
+            async with self.bot.rate_limiter.slot(key, RateLimiter.DELETE, group=("guild", message.guild.id)):
+                await message.delete()
+        except discord.HTTPException as exc:
+            log.info(f"Couldn't delete reposted message {message.id}: {exc}")
+
+        self.timings["delete"].append(time.perf_counter() - start)
+
+    def percentile(self, stage, percentile):
+        """Gets a percentile of the recent latencies of a stage in seconds."""
+
+        timings = sorted(self.timings[stage])
+        if not timings:
+            return 0.0
+
+        return timings[min(len(timings) - 1, int(len(timings) * percentile))]
@@ -0,0 +1,124 @@
+import asyncio
+import collections
+import time
+
+class RepostScheduler:
+    """Runs reposts one at a time per guild, in the order they were submitted.
+
+    Each guild gets its own queue and worker, so a webhook can't be moved by
+    one repost in between another repost's move and send, while separate
+    guilds still run in parallel. Idle workers exit after idle_timeout seconds.
+    """
+
+    def __init__(self, *, idle_timeout=60, samples=1000):
+        self.idle_timeout = idle_timeout
+
+        self._queues = {}
+        self._workers = {}
+        self._closed = False
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.max_depth = 0
+
+        # Recent queue wait times in seconds
+        self.waits = collections.deque(maxlen=samples)
+
+    async def submit(self, key, func, *args):
+        """Queues func(*args) for a guild and waits for its result."""
+
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = asyncio.Queue()
+            self._workers[key] = asyncio.create_task(self._worker(key, queue))
+
+        future = asyncio.get_running_loop().create_future()
+        queue.put_nowait((func, args, future, time.perf_counter()))
+
+        self.submitted += 1
+        self.max_depth = max(self.max_depth, queue.qsize())
+
+        return await future
+
+    async def _worker(self, key, queue):
+        try:
+            while True:
+                try:
+                    func, args, future, queued_at = await asyncio.wait_for(queue.get(), timeout=self.idle_timeout)
+                except asyncio.TimeoutError:
+                    # wait_for yields while it cancels the get, so a repost can be queued after the timeout
+                    if queue.empty():
+                        return
+                    continue
+
+                self.waits.append(time.perf_counter() - queued_at)
+
+                # The caller gave up waiting
+                if future.done():
+                    continue
+
+                try:
+                    result = await func(*args)
+                except asyncio.CancelledError:
+                    self.failed += 1
+                    if not future.done():
+                        future.cancel()
+
+                    # Only stop if the worker itself was cancelled, not just the repost
+                    if self._closed:
+                        raise
+                except Exception as exc:
+                    self.failed += 1
+                    if not future.done():
+                        future.set_exception(exc)
+                else:
+                    self.completed += 1
+                    if not future.done():
+                        future.set_result(result)
+        finally:
+            if self._workers.get(key) is asyncio.current_task():
+                del self._queues[key]
+                del self._workers[key]
+
+                # Nothing will run what's left, so don't leave callers waiting on it
+                while not queue.empty():
+                    func, args, future, queued_at = queue.get_nowait()
+                    future.cancel()
+
+    @property
+    def active(self):
+        """The number of guilds with a running worker."""
+
+        return len(self._workers)
+
+    @property
+    def depth(self):
+        """The number of reposts waiting in every queue."""
+
+        return sum(queue.qsize() for queue in self._queues.values())
+
+    def wait_percentile(self, percentile):
+        """Gets a percentile of the recent queue wait times in seconds."""
+
+        if not self.waits:
+            return 0.0
+
+        waits = sorted(self.waits)
+        return waits[min(len(waits) - 1, int(len(waits) * percentile))]
+
+    def close(self):
+        """Stops every worker."""
+
+        self._closed = True
+
+        for worker in self._workers.values():
+            worker.cancel()
+
+        for queue in self._queues.values():
+            while not queue.empty():
+                func, args, future, queued_at = queue.get_nowait()
+                future.cancel()
+
+        self._queues.clear()
+        self._workers.clear()
@@ -0,0 +1,189 @@
+import discord
+
+import asyncio
+import collections
+import datetime
+import logging
+
+log = logging.getLogger("emote_wizard.webhooks")
+
+class WebhookPool:
+    """Represents the bot owned webhooks of each guild, one per channel.
+
+    Keeping a webhook in every active channel avoids moving a single webhook
+    back and forth. Once a guild reaches max_webhooks or one of Discord's
+    webhook limits, the least recently used webhook is moved instead.
+
+    When each webhook was last used is written to the database in batches
+    every flush_interval seconds, so the order survives a restart.
+    """
+
+    # Maximum webhooks in a channel and maximum webhooks in a guild
+    LIMIT_ERRORS = (30007, 30058)
+
+    def __init__(self, bot, *, max_webhooks=10, flush_interval=60):
+        self.bot = bot
+        self.max_webhooks = max_webhooks
+        self.flush_interval = flush_interval
+
+        self._guilds = {}
+        self._locks = collections.defaultdict(asyncio.Lock)
+
+        # Webhook IDs mapped to when they were last used, until they're written
+        self._used = {}
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    def _partial(self, webhook_id, token):
+        return discord.Webhook.partial(webhook_id, token, client=self.bot, bot_token=self.bot.http.token)
+
+    async def _load(self, guild):
+        webhooks = self._guilds.get(guild.id)
+        if webhooks is not None:
+            return webhooks
+
+        query = """SELECT *
+                   FROM webhook_pool
+                   WHERE webhook_pool.guild_id=$1
+                   ORDER BY webhook_pool.last_used;
+                """
+        records = await self.bot.db.fetch(query, guild.id)
+
+        # Uses that haven't been written yet are newer than the rows
+        records = sorted(records, key=lambda record: self._used.get(record["webhook_id"], record["last_used"]))
+
+        webhooks = collections.OrderedDict()
+        for record in records:
+            webhooks[record["channel_id"]] = self._partial(record["webhook_id"], record["webhook_token"])
+
+        self._guilds[guild.id] = webhooks
+        return webhooks
+
+    async def _save(self, guild, channel, webhook):
+        # Replace any rows for the webhook's old channel or the channel's old webhook
+        async with self.bot.db.acquire() as conn:
+            async with conn.transaction():
+                query = """DELETE FROM webhook_pool
+                           WHERE webhook_pool.webhook_id=$1 OR webhook_pool.channel_id=$2;
+                        """
+                await conn.execute(query, webhook.id, channel.id)
+
+                query = """INSERT INTO webhook_pool (webhook_id, webhook_token, guild_id, channel_id, last_used)
+                           VALUES ($1, $2, $3, $4, $5);
+                        """
+                await conn.execute(query, webhook.id, webhook.token, guild.id, channel.id, datetime.datetime.utcnow())
+
+        self._used.pop(webhook.id, None)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+
+            try:
+                await self.flush()
+            except Exception as exc:
+                log.warning(f"Couldn't write webhook use times: {exc}")
+
+    async def flush(self):
+        """Writes when each webhook was last used."""
+
+        if not self._used:
+            return
+
+        used, self._used = self._used, {}
+
+        query = """UPDATE webhook_pool
+                   SET last_used=$2
+                   WHERE webhook_pool.webhook_id=$1;
+                """
+        try:
+            await self.bot.db.executemany(query, list(used.items()))
+        except BaseException:
+            # Put them back, without overwriting newer uses, so the next flush retries them
+            self._used = {**used, **self._used}
+            raise
+
+    async def get(self, channel):
+        """Gets the webhook for a channel, creating or moving one if needed.
+
+        Returns None if no webhook could be created and there are none to move.
+        """
+
+        webhooks = await self._load(channel.guild)
+
+        webhook = webhooks.get(channel.id)
+        if webhook:
+            webhooks.move_to_end(channel.id)
+            self._used[webhook.id] = datetime.datetime.utcnow()
+            return webhook
+
+        async with self._locks[channel.guild.id]:
+            # Another message might have made one while we were waiting
+            webhook = webhooks.get(channel.id)
+            if webhook:
+                return webhook
+
+            if len(webhooks) < self.max_webhooks:
+                try:
+                    webhook = await channel.create_webhook(name="Emote Hook")
+                except discord.HTTPException as exc:
+                    if exc.code not in self.LIMIT_ERRORS:
+                        raise
+
+            # Move the least recently used webhook over to this channel
+            if not webhook and webhooks:
+                channel_id, webhook = webhooks.popitem(last=False)
+                webhook = await webhook.edit(channel=channel)
+
+            if not webhook:
+                return None
+
+            webhooks[channel.id] = webhook
+            await self._save(channel.guild, channel, webhook)
+
+            return webhook
+
+    def forget(self, channel):
+        """Forgets the webhook for a channel, for example after it was deleted."""
+
+        webhooks = self._guilds.get(channel.guild.id)
+        if webhooks:
+            webhooks.pop(channel.id, None)
+
+    def forget_guild(self, guild_id):
+        """Forgets every webhook of a guild, so they are loaded again if they are needed."""
+
+        self._guilds.pop(guild_id, None)
+
+        lock = self._locks.get(guild_id)
+        if lock and not lock.locked():
+            del self._locks[guild_id]
+
+    async def delete_guild(self, guild):
+        """Deletes every pooled webhook of a guild, for example after it stopped reposting."""
+
+        async with self._locks[guild.id]:
+            webhooks = await self._load(guild)
+
+            for webhook in webhooks.values():
+                self._used.pop(webhook.id, None)
+
+                try:
+                    await webhook.delete(reason="Webhook unbound")
+                except discord.HTTPException as exc:
+                    log.info(f"Couldn't delete pooled webhook {webhook.id}: {exc}")
+
+            query = """DELETE FROM webhook_pool
+                       WHERE webhook_pool.guild_id=$1;
+                    """
+            await self.bot.db.execute(query, guild.id)
+
+            self._guilds.pop(guild.id, None)
+
+        return len(webhooks)
+
+    async def close(self):
+        """Stops the background writer and writes the use times still queued."""
+
+        self._flusher.cancel()
+        await asyncio.gather(self._flusher, return_exceptions=True)
+        await self.flush()
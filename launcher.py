@@ -0,0 +1,122 @@
+"""Runs the bot as a cluster of processes, each connecting a range of the shards.
+
+Usage: python launcher.py [--processes 2] [--shards 16]
+
+The shard count defaults to config.shard_count or the count Discord recommends,
+and the process count defaults to config.processes or one per CPU.
+"""
+
+import aiohttp
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+
+import config
+
+logging.basicConfig(level=logging.INFO, format="(%(asctime)s) %(levelname)s [launcher] %(message)s", datefmt="%m/%d/%y - %H:%M:%S %Z",)
+
+def run_cluster(cluster_id, shard_ids, shard_count):
+    # Imported here so the launcher itself doesn't load discord.py and the cogs
+    from bot import EmoteWizard
+
+    EmoteWizard(cluster_id=cluster_id, shard_ids=shard_ids, shard_count=shard_count).run()
+
+async def get_gateway():
+    async with aiohttp.ClientSession() as session:
+        async with session.get("https://discord.com/api/v10/gateway/bot", headers={"Authorization": f"Bot {config.token}"}) as resp:
+            resp.raise_for_status()
+            return await resp.json()
+
+def split(shard_count, processes):
+    """Splits the shards into contiguous ranges of nearly equal size."""
+
+    size, extra = divmod(shard_count, processes)
+    ranges = []
+    start = 0
+
+    for cluster_id in range(processes):
+        end = start + size + (1 if cluster_id < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+
+    return [shard_ids for shard_ids in ranges if shard_ids]
+
+class Cluster:
+    """Represents a process running some of the shards, restarted when it exits."""
+
+    def __init__(self, cluster_id, shard_ids, shard_count):
+        self.cluster_id = cluster_id
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+
+        self.process = None
+        self.started_at = 0
+        self.restarts = 0
+
+    def start(self):
+        context = multiprocessing.get_context("spawn")
+        self.process = context.Process(
+            target=run_cluster,
+            args=(self.cluster_id, self.shard_ids, self.shard_count),
+            name=f"cluster-{self.cluster_id}",
+            daemon=True
+        )
+        self.process.start()
+        self.started_at = time.monotonic()
+
+        logging.info(f"Started cluster {self.cluster_id} (shards {self.shard_ids[0]}-{self.shard_ids[-1]}) as process {self.process.pid}")
+
+    def stop(self):
+        if self.process and self.process.is_alive():
+            self.process.terminate()
+            self.process.join(10)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the bot as a cluster of processes")
+    parser.add_argument("--processes", type=int, default=getattr(config, "processes", None) or os.cpu_count() or 1)
+    parser.add_argument("--shards", type=int, default=getattr(config, "shard_count", None))
+    args = parser.parse_args()
+
+    gateway = asyncio.run(get_gateway())
+    shard_count = args.shards or gateway["shards"]
+
+    # Only max_concurrency shards can identify every 5 seconds, so give each process time to identify its shards
+    max_concurrency = gateway["session_start_limit"]["max_concurrency"]
+
+    clusters = [Cluster(cluster_id, shard_ids, shard_count) for cluster_id, shard_ids in enumerate(split(shard_count, args.processes))]
+    logging.info(f"Running {shard_count} shards in {len(clusters)} processes")
+
+    try:
+        for cluster in clusters:
+            cluster.start()
+            time.sleep(len(cluster.shard_ids) / max_concurrency * 5)
+
+        while True:
+            time.sleep(5)
+
+            for cluster in clusters:
+                if cluster.process.is_alive():
+                    continue
+
+                logging.warning(f"Cluster {cluster.cluster_id} exited with code {cluster.process.exitcode}")
+
+                # Back off if it keeps crashing right after starting
+                if time.monotonic() - cluster.started_at < 60:
+                    cluster.restarts += 1
+                else:
+                    cluster.restarts = 0
+
+                time.sleep(min(2 ** cluster.restarts, 60))
+                cluster.start()
+    except KeyboardInterrupt:
+        logging.info("Stopping the cluster")
+    finally:
+        for cluster in clusters:
+            cluster.stop()
+
+if __name__ == "__main__":
+    main()